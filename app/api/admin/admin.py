@@ -0,0 +1,77 @@
+from fastapi import APIRouter, HTTPException, Depends, Path, Query, Request
+from fastapi.responses import StreamingResponse
+from app.api.auth.auth import get_current_admin
+from app.bulk import export_rows, import_rows, BulkImportError
+from app.models import User
+from typing import Optional
+
+admin_router = APIRouter()
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+@admin_router.get("/admin/export/{table}")
+async def export_table(table: str = Path(..., pattern="^(tasks|ratings)$"),
+                       format: str = Query("ndjson", pattern="^(csv|ndjson|parquet)$"),
+                       gzip: bool = False, after_id: Optional[int] = None,
+                       current_admin: User = Depends(get_current_admin)):
+    """
+    Exports every translation task or rating, streamed in ID order with constant memory.
+
+    Args:
+        table (str): "tasks" or "ratings".
+        format (str): "csv", "ndjson" or "parquet".
+        gzip (bool): If true, the file is gzipped on the fly. Ignored for Parquet, which is compressed internally.
+        after_id (Optional[int]): Only rows after this ID are exported, to resume an interrupted export.
+        current_admin (User): The current administrator.
+
+    Returns:
+        StreamingResponse: The exported file.
+
+    Raises:
+        HTTPException: If Parquet is requested but pyarrow is not installed.
+    """
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed") from e
+        gzip = False
+
+    filename = f"{table}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_rows(table, format, gzip=gzip, after_id=after_id),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@admin_router.post("/admin/import/{table}")
+async def import_table(request: Request, table: str = Path(..., pattern="^(tasks|ratings)$"),
+                       format: str = Query("csv", pattern="^(csv|ndjson)$"),
+                       current_admin: User = Depends(get_current_admin)):
+    """
+    Imports translation tasks or ratings from the request body, as produced by the export.
+
+    The body is streamed into Postgres with COPY, so files of any size can be sent.
+    Send gzipped files with a `Content-Encoding: gzip` header.
+
+    Args:
+        request (Request): The request, whose body is the file.
+        table (str): "tasks" or "ratings".
+        format (str): "csv" (with a header line) or "ndjson".
+        current_admin (User): The current administrator.
+
+    Returns:
+        Dict[str, int]: The number of rows read and the number of rows imported.
+
+    Raises:
+        HTTPException: If the file can't be loaded.
+    """
+    gzip = request.headers.get("Content-Encoding", "").lower() == "gzip"
+    try:
+        return await import_rows(table, format, request.stream(), gzip=gzip)
+    except BulkImportError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
@@ -1,11 +1,18 @@
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import HTTPBearer
-from app.models import UserIn, UserOut, Token
-from app.crud import create_user, get_user, blacklist_token
+from app.models import UserIn, UserOut, Token, User, PasswordChangeIn
+from app.crud import create_user, get_user, update_user_password
+from app.database import get_session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.blacklist import token_blacklist, token_digest
+from app.cache import LRUCache
+from app.hashing import password_hasher, HashingPoolFull
+from app.metrics import timed
 from datetime import datetime, timedelta
-import bcrypt
 import jwt
 import os
+import time
+import uuid
 
 auth_router = APIRouter()
 
@@ -16,110 +23,231 @@ ALGORITHM = os.environ.get("ENCRYPT_ALGORITHM")
 access_token_jwt_subject = "access"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Authenticated users are cached briefly so most requests don't query the users table
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 60))
+user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+# Verified tokens, by digest, so repeat requests skip signature verification. Entries expire with their token.
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 10000))
+token_cache = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+
+# Users allowed to use the /admin routes
+ADMIN_USERNAMES = {name.strip() for name in os.environ.get("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
 # Instance of HTTPBearer to get token
 bearer = HTTPBearer()
 
 @auth_router.post("/register", response_model=UserOut)
-async def register(user: UserIn):
+async def register(user: UserIn, session: AsyncSession = Depends(get_session)):
     """
     Registers a new user.
 
     Args:
         user (UserIn): The input data for the new user.
+        session (AsyncSession): The database session.
 
     Returns:
         UserOut: The registered user.
 
     Raises:
-        HTTPException: If the username is already registered.
+        HTTPException: If the username is already registered, or the server is too busy to hash the password.
     """
     # Check if user already exists
-    existing_user = await get_user(user.username)
+    existing_user = await get_user(session, user.username)
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already registered")
 
-    # Hash the password
-    hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt())
+    # Hash the password, off the event loop
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except HashingPoolFull as e:
+        raise HTTPException(status_code=503, detail="Server busy, try again later", headers={"Retry-After": "1"}) from e
 
     # Store in db
-    await create_user(user.username, hashed_password.decode('utf-8'))
+    await create_user(session, user.username, hashed_password)
 
     return UserOut(username=user.username)
 
 @auth_router.post("/login", response_model=Token)
-async def login(user: UserIn):
+async def login(user: UserIn, session: AsyncSession = Depends(get_session)):
     """
     Logs in a user and returns an access token.
 
     Args:
         user (UserIn): The input data for the user login.
+        session (AsyncSession): The database session.
 
     Returns:
         Token: The access token.
 
     Raises:
-        HTTPException: If the username or password is incorrect.
+        HTTPException: If the username or password is incorrect, or the server is too busy to check the password.
     """
     # Fetch user from the database
-    db_user = await get_user(user.username)
+    db_user = await get_user(session, user.username)
 
     # Check if user exists
     if not db_user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     
-    # Verify the hashed password
-    if not bcrypt.checkpw(user.password.encode('utf-8'), db_user.hashed_password.encode('utf-8')):
+    # Verify the hashed password, off the event loop
+    try:
+        password_matches = await password_hasher.check(user.password, db_user.hashed_password)
+    except HashingPoolFull as e:
+        raise HTTPException(status_code=503, detail="Server busy, try again later", headers={"Retry-After": "1"}) from e
+
+    if not password_matches:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
 
+    return create_access_token(db_user)
+
+def create_access_token(user: User) -> Token:
+    """
+    Issues an access token for a user.
+
+    The token carries the user's ID and token version, so authenticating it needs no database query.
+
+    Args:
+        user (User): The user, as stored in the database.
+
+    Returns:
+        Token: The access token.
+    """
     # Expiration included for added security. Re-login required.
     expire = datetime.now() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
-    # Generate JWT token
-    access_token = jwt.encode({"sub": user.username, "exp": expire }, SECRET_KEY, algorithm=ALGORITHM)
+    # Generate JWT token. The jti makes every token unique, so logging one out never affects another.
+    claims = {"sub": user.username, "uid": user.id, "ver": user.token_version or 0, "exp": expire, "jti": uuid.uuid4().hex}
+    access_token = jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
     return Token(access_token=access_token, token_type="Bearer")
 
+async def get_current_user(token: str = Depends(bearer), session: AsyncSession = Depends(get_session)):
+    """
+    Retrieves the current authenticated user based on the provided token.
+
+    Tokens are verified once per worker, then found in `token_cache` until they expire. The user comes from
+    the token claims, so neither path queries the database, except for tokens issued without a user ID.
+
+    Args:
+        token (str): The access token.
+        session (AsyncSession): The database session.
+
+    Returns:
+        User: The current authenticated user.
+
+    Raises:
+        HTTPException: If the token is invalid or revoked, or the user is not found.
+    """
+    digest = token_digest(token.credentials)
+    cached = token_cache.get(digest)
+    if cached is None:
+        try:
+            # Decode the token
+            with timed("jwt"):
+                # Every token we issue expires, and its expiry bounds how long it is cached and blacklisted
+                payload = jwt.decode(token.credentials, SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp"]})
+        except jwt.PyJWTError as e:
+            raise HTTPException(status_code=401, detail="Invalid credentials. Try logging in again") from e
+
+        username = payload.get("sub")
+        if username is None:
+            raise HTTPException(status_code=401, detail="Invalid Credentials")
+
+        if payload.get("uid") is not None:
+            # Everything the routes need is in the claims
+            user = User(id=payload["uid"], username=username)
+        else:
+            # Tokens issued before the claims carried the user ID: fetch the user from the cache, or from our database
+            with timed("user"):
+                user = user_cache.get(username)
+                if user is None:
+                    user = await get_user(session, username)
+                    if user is None:
+                        raise HTTPException(status_code=401, detail="User not found")
+                    user_cache.set(username, user)
+
+        cached = (user, payload.get("ver", 0))
+        token_cache.set(digest, cached, ttl=payload["exp"] - time.time())
+
+    (user, token_version) = cached
+    # Tokens issued before the user's last password change
+    if not token_blacklist.is_current(user.id, token_version):
+        raise HTTPException(status_code=401, detail="Token revoked. Try logging in again")
+
+    return user
+
 @auth_router.post("/logout")
-async def logout(token: str = Depends(bearer)):
+async def logout(token: str = Depends(bearer), current_user: User = Depends(get_current_user),
+                 session: AsyncSession = Depends(get_session)):
     """
     Logs out a user by blacklisting the token.
 
+    Only valid tokens are blacklisted, so clients can't fill the blacklist with made-up ones.
+
     Args:
         token (str): The access token.
+        current_user (User): The current authenticated user, proving the token is valid.
+        session (AsyncSession): The database session.
 
     Returns:
         Dict[str, str]: A dictionary indicating the status and message of the logout.
     """
     # Blacklist the token
     token_str = token.credentials
-    await blacklist_token(token_str)
+    await token_blacklist.revoke(session, token_str)
     return {"status": "success", "message": "Successfully logged out."}
 
-async def get_current_user(token: str = Depends(bearer)):
+@auth_router.post("/password", response_model=Token)
+async def change_password(passwords: PasswordChangeIn, current_user: User = Depends(get_current_user),
+                          session: AsyncSession = Depends(get_session)):
     """
-    Retrieves the current authenticated user based on the provided token.
+    Changes the current user's password, revoking all their tokens, and returns a new access token.
 
     Args:
-        token (str): The access token.
+        passwords (PasswordChangeIn): The current and the new password.
+        current_user (User): The current authenticated user.
+        session (AsyncSession): The database session.
 
     Returns:
-        User: The current authenticated user.
+        Token: A new access token. The previous ones are rejected from now on by this worker, and by the
+        others after their next blacklist sync.
 
     Raises:
-        HTTPException: If the token is invalid or the user is not found.
+        HTTPException: If the current password is incorrect, or the server is too busy to hash the passwords.
     """
+    db_user = await get_user(session, current_user.username)
+    if not db_user:
+        raise HTTPException(status_code=401, detail="User not found")
+
     try:
-        # Decode the token
-        payload = jwt.decode(token.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid Credentials")
+        if not await password_hasher.check(passwords.old_password, db_user.hashed_password):
+            raise HTTPException(status_code=400, detail="Incorrect password")
+        hashed_password = await password_hasher.hash(passwords.new_password)
+    except HashingPoolFull as e:
+        raise HTTPException(status_code=503, detail="Server busy, try again later", headers={"Retry-After": "1"}) from e
+
+    token_version = await update_user_password(session, db_user.id, hashed_password)
+    token_blacklist.revoke_user(db_user.id, token_version)
+    user_cache.pop(db_user.username)
+
+    db_user.token_version = token_version
+    return create_access_token(db_user)
+
+async def get_current_admin(current_user: User = Depends(get_current_user)):
+    """
+    Retrieves the current authenticated user, who must be an administrator (listed in ADMIN_USERNAMES).
+
+    Args:
+        current_user (User): The current authenticated user.
 
-        # Fetch the user from our database
-        user = await get_user(username)
-        if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
+    Returns:
+        User: The current administrator.
 
-        return user
+    Raises:
+        HTTPException: If the user is not an administrator.
+    """
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="Administrator access required")
 
-    except jwt.PyJWTError as e:
-        raise HTTPException(status_code=401, detail="Invalid credentials. Try logging in again") from e
\ No newline at end of file
+    return current_user
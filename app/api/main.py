@@ -1,11 +1,53 @@
 from fastapi import FastAPI, HTTPException, Depends
 from .auth.auth import auth_router
 from .translation.translation import translation_router
-from app.middleware import TokenBlacklistMiddleware
+from .stats.stats import stats_router
+from .admin.admin import admin_router
+from app.middleware import TokenBlacklistMiddleware, MetricsMiddleware
+from app.workers import task_workers
+from app.blacklist import token_blacklist
+from app.utils import supported_languages
+from app.database import async_engine, warm_up_pool
+from app.responses import JSONResponse
+import asyncio
+import logging
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+app = FastAPI(default_response_class=JSONResponse)
 
 app.add_middleware(TokenBlacklistMiddleware)
+# Added last so it is the outermost middleware and times the whole request
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth_router)
-app.include_router(translation_router)
\ No newline at end of file
+app.include_router(translation_router)
+app.include_router(stats_router)
+app.include_router(admin_router)
+
+@app.on_event("startup")
+async def warm_up():
+    # The worker only accepts traffic once startup is done, so the first requests find everything ready
+    results = await asyncio.gather(
+        supported_languages.load(),
+        warm_up_pool(),
+        return_exceptions=True,
+    )
+    # Not fatal, requests load them lazily
+    for step, result in zip(("supported languages", "database pool"), results):
+        if isinstance(result, Exception):
+            logger.warning("Could not warm up the %s: %s", step, result)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    await token_blacklist.start()
+    task_workers.start()
+    supported_languages.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await supported_languages.stop()
+    await task_workers.stop()
+    await token_blacklist.stop()
+    # Close pooled connections cleanly rather than leaving them to the database to time out
+    await async_engine.dispose()
@@ -0,0 +1,140 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.crud import get_rating_stats
+from app.models import QualityStatsOut
+from typing import List, Optional
+from fastapi.responses import PlainTextResponse
+from app.metrics import registry
+from app.database import async_engine, get_session
+from app.api.auth.auth import user_cache, token_cache
+from app.api.translation.translation import response_cache
+from app.chunking import chunk_cache
+from app.languages import detection_cache
+from app.translation_memory import translation_memory
+from app.utils import batcher, provider, admission
+from app.hashing import password_hasher
+
+stats_router = APIRouter()
+
+
+def _cache_counters():
+    caches = {
+        "translation_memory": translation_memory._cache,
+        "user": user_cache,
+        "token": token_cache,
+        "chunk": chunk_cache,
+        "language_detection": detection_cache,
+        "response": response_cache,
+    }
+    counters = {}
+    for name, cache in caches.items():
+        stats = cache.stats()
+        counters[(name, "hit")] = stats["hits"]
+        counters[(name, "miss")] = stats["misses"]
+    return counters
+
+
+def _pool_gauges():
+    pool = async_engine.pool
+    return {
+        ("size",): pool.size(),
+        ("checked_out",): pool.checkedout(),
+        ("checked_in",): pool.checkedin(),
+        # The pool counts overflow from -pool_size
+        ("overflow",): max(pool.overflow(), 0),
+    }
+
+
+registry.callback("cache_requests_total", "Cache lookups by result", "counter", ("cache", "result"), _cache_counters)
+registry.callback("db_pool_connections", "Database connection pool usage", "gauge", ("state",), _pool_gauges)
+registry.callback("translation_memory_requests_total", "Translation memory lookups by result", "counter", ("result",),
+                  lambda: {("hit",): translation_memory.hits, ("miss",): translation_memory.misses,
+                                  ("fuzzy_hit",): translation_memory.fuzzy_hits})
+registry.callback("micro_batch_queue_depth", "Translations waiting for a provider batch", "gauge", (),
+                  lambda: {(): batcher.queue_depth})
+registry.callback("admission_in_flight", "Translation requests holding a provider slot", "gauge", (),
+                  lambda: {(): admission.in_flight})
+
+
+@stats_router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Exposes the metrics in the Prometheus text format: latency histograms per route, crud function,
+    request stage and provider call, cache and provider character counters, and connection pool gauges.
+
+    Returns:
+        str: The metrics.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@stats_router.get("/stats/translation-memory")
+async def translation_memory_stats():
+    """
+    Reports translation memory hit/miss counters and in-process cache usage.
+
+    Returns:
+        Dict[str, Any]: The translation memory counters.
+    """
+    return translation_memory.stats()
+
+@stats_router.get("/stats/batching")
+async def batching_stats():
+    """
+    Reports the micro-batching queue depth and batch size histograms.
+
+    Returns:
+        Dict[str, Any]: The micro-batcher settings and counters.
+    """
+    return batcher.stats()
+
+@stats_router.get("/stats/hashing")
+async def hashing_stats():
+    """
+    Reports password hashing pool usage and latency histograms, to tune HASH_ROUNDS against capacity.
+
+    Returns:
+        Dict[str, Any]: The password hasher settings and counters.
+    """
+    return password_hasher.stats()
+
+@stats_router.get("/stats/providers")
+async def provider_stats():
+    """
+    Reports the translation provider settings, retries and rate limits, and the admission control queues.
+    With several providers, also reports each provider's circuit state and latency per language pair,
+    and the hedging and failover counters.
+
+    Returns:
+        Dict[str, Any]: The provider counters.
+    """
+    return {**provider.stats(), "admission": admission.stats()}
+
+@stats_router.get("/stats/quality", response_model=List[QualityStatsOut])
+async def quality_stats(source_language: Optional[str] = None, target_language: Optional[str] = None,
+                        session: AsyncSession = Depends(get_session)):
+    """
+    Reports the translation ratings per language pair: their number, average and histogram.
+
+    Reads the incrementally maintained rating_stats table, so the cost depends on the number of
+    language pairs, not on the number of ratings.
+
+    Args:
+        source_language (Optional[str]): Only pairs translating from this language.
+        target_language (Optional[str]): Only pairs translating to this language.
+        session (AsyncSession): The database session.
+
+    Returns:
+        List[QualityStatsOut]: The rating stats of each language pair.
+    """
+    stats = await get_rating_stats(session, source_language, target_language)
+    return [
+        QualityStatsOut(
+            source_language=pair.source_language,
+            target_language=pair.target_language,
+            count=pair.rating_count,
+            average=pair.rating_sum / pair.rating_count if pair.rating_count else None,
+            histogram={str(value): getattr(pair, f"rating_{value}") for value in range(1, 6)},
+        )
+        for pair in stats
+    ]
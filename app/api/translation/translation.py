@@ -1,56 +1,207 @@
-from fastapi import APIRouter, HTTPException, Depends
-from app.models import TranslationTaskIn, TranslationTaskOut, User, RatingIn, RatingOut
-from app.crud import create_translation_task, get_translation_tasks, get_translation_task_by_id, create_translation_rating, get_rating_by_task_id, remove_rating
+from fastapi import APIRouter, HTTPException, Depends, Body, Query, Header
+from app.models import TranslationTaskIn, TranslationTaskOut, TaskStatus, User, RatingIn, RatingOut
+from app.crud import create_translation_task, create_translation_tasks, get_translation_tasks, stream_translation_tasks, TRANSLATION_TASK_FIELDS, get_translation_task_by_id, create_translation_rating, get_task_with_rating, remove_rating
 from app.api.auth.auth import get_current_user
-from app.utils import mock_translate, translate_text
-from typing import List
+from app.utils import translate_texts, check_languages, admission, retry_after
+from app.ratelimit import AdmissionRejected
+from app.translation_memory import translation_memory, text_digest, translate_with_memory
+from app.chunking import translate_document, DOCUMENT_CHUNK_CHARS
+from app.workers import task_workers
+from app.database import get_session, release_connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.responses import StreamingResponse
+from app.responses import JSONResponse, dumps, cached_response, conditional_response
+from app.cache import LRUCache
+from typing import List, Optional
+import asyncio
+import os
 
 translation_router = APIRouter()
 
+# Maximum number of tasks accepted by POST /tasks/batch
+BATCH_MAX_TASKS = int(os.environ.get("BATCH_MAX_TASKS", 1000))
+# Maximum page size of GET /tasks
+LIST_MAX_LIMIT = int(os.environ.get("LIST_MAX_LIMIT", 10000))
+# Rendered responses of GET /tasks/{task_id} and GET /tasks/{task_id}/rate kept in process
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 10000))
+# Finished tasks never change, but ratings do: a rating changed through another worker is seen after at most this long
+RESPONSE_CACHE_RATING_TTL = float(os.environ.get("RESPONSE_CACHE_RATING_TTL", 5))
+
+# Keyed by ("task", task_id) and ("rating", task_id)
+response_cache = LRUCache(maxsize=RESPONSE_CACHE_SIZE)
+
 @translation_router.post("/tasks", response_model=TranslationTaskOut)
-async def create_task(task: TranslationTaskIn, current_user: User = Depends(get_current_user)):
+async def create_task(task: TranslationTaskIn, async_mode: bool = Query(False, alias="async"),
+                      current_user: User = Depends(get_current_user),
+                      session: AsyncSession = Depends(get_session)):
     """
     Creates a translation task.
 
     Args:
         task (TranslationTaskIn): The input data for the translation task.
+        async_mode (bool): If true, the task is queued and returned immediately with status pending.
+            Poll GET /tasks/{task_id} for the result.
         current_user (User): The current authenticated user.
+        session (AsyncSession): The database session.
 
     Returns:
-        TranslationTaskOut: The created translation task.
-    """
-    # Used to save on API Costs
-    #translated_text = mock_translate(task.text_to_translate, task.target_language)
+        TranslationTaskOut: The created translation task. Its match_score is 1 when a past translation of the same
+        text was reused, and below 1 when the user's past translation of a similar text is suggested in
+        suggested_translation.
 
-    # Uses Google Cloud Translation API for translation
+    Raises:
+        HTTPException: 429 with Retry-After when the provider quota is exhausted or the user has too many requests waiting.
+    """
+    # Uses the provider selected by TRANSLATION_PROVIDER (set it to "mock" to save on API costs)
     source_language = task.source_language or None
 
-    (translated_text, source_language) = translate_text(source_language, task.target_language, task.text_to_translate)
+    if async_mode:
+        # Reject unsupported languages now rather than in the worker. An unsupported source is stored as None,
+        # for the worker to detect, like the synchronous path does.
+        source_language = await check_languages(source_language, task.target_language)
+        queued_task = await create_translation_task(session, current_user.id, task, source_language, None, status=TaskStatus.PENDING)
+        task_workers.notify()
+        return queued_task
+
+    try:
+        (translated_text, source_language, digest, match) = await translate_with_memory(
+            session, source_language, task.target_language, task.text_to_translate, user_id=current_user.id)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": retry_after(e.retry_after)}) from e
+
+    created_task = await create_translation_task(session, current_user.id, task, source_language, translated_text, text_digest=digest)
+    if match:
+        (created_task.suggested_translation, created_task.match_score) = match
+    return created_task
+
+@translation_router.post("/tasks/batch", response_model=List[TranslationTaskOut])
+async def create_tasks_batch(tasks: List[TranslationTaskIn] = Body(...), current_user: User = Depends(get_current_user),
+                             session: AsyncSession = Depends(get_session)):
+    """
+    Creates several translation tasks in one request.
+
+    Tasks are grouped by language pair and each group is sent to the provider as multi-segment calls.
+    Texts already in the translation memory are not sent at all, and the results are stored with a single bulk INSERT.
+
+    Args:
+        tasks (List[TranslationTaskIn]): The input data for each translation task.
+        current_user (User): The current authenticated user.
+        session (AsyncSession): The database session.
+
+    Returns:
+        List[TranslationTaskOut]: The created translation tasks, in input order.
+
+    Raises:
+        HTTPException: If the batch is too large or a target language is not supported,
+            or 429 with Retry-After when the provider quota is exhausted.
+    """
+    if len(tasks) > BATCH_MAX_TASKS:
+        raise HTTPException(status_code=413, detail=f"A batch can hold at most {BATCH_MAX_TASKS} tasks")
+
+    # Validate every language pair before spending anything on the provider
+    sources = [await check_languages(task.source_language, task.target_language) for task in tasks]
+    digests = [text_digest(source, task.target_language, task.text_to_translate) for source, task in zip(sources, tasks)]
+
+    results = await translation_memory.get_many(session, digests)
+    await release_connection(session)
+
+    # Group the remaining unique texts by language pair
+    groups = {}
+    for source, task, digest in zip(sources, tasks, digests):
+        if digest not in results:
+            groups.setdefault((source, task.target_language), {}).setdefault(digest, task.text_to_translate)
 
-    return await create_translation_task(current_user.id, task, source_language, translated_text)
+    async def translate_group(source, target, texts):
+        # Texts too large for a single provider call are chunked like in POST /tasks, the others share calls
+        short = {digest: text for digest, text in texts.items() if len(text) <= DOCUMENT_CHUNK_CHARS}
+        long = {digest: text for digest, text in texts.items() if len(text) > DOCUMENT_CHUNK_CHARS}
+        async with admission.slot(current_user.id, sum(len(text) for text in texts.values())):
+            (short_translations, *long_translations) = await asyncio.gather(
+                translate_texts(source, target, list(short.values())),
+                *(translate_document(source, target, text) for text in long.values()),
+            )
+        for digest, translation in zip([*short, *long], [*short_translations, *long_translations]):
+            results[digest] = translation
+            translation_memory.put(digest, *translation)
+
+    try:
+        await asyncio.gather(*(translate_group(source, target, texts) for (source, target), texts in groups.items()))
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": retry_after(e.retry_after)}) from e
+
+    rows = [
+        {
+            "source_language": results[digest][1],
+            "target_language": task.target_language,
+            "text_to_translate": task.text_to_translate,
+            "translated_text": results[digest][0],
+            "text_digest": digest,
+        }
+        for task, digest in zip(tasks, digests)
+    ]
+    return await create_translation_tasks(session, current_user.id, rows)
 
 @translation_router.get("/tasks", response_model=List[TranslationTaskOut])
-async def list_tasks(current_user: User = Depends(get_current_user)):
+async def list_tasks(cursor: Optional[int] = None, limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_LIMIT),
+                     fields: Optional[str] = None, format: str = Query("json", pattern="^(json|ndjson)$"),
+                     current_user: User = Depends(get_current_user),
+                     session: AsyncSession = Depends(get_session)):
     """
-    Lists the translation tasks associated with the current user.
+    Lists the translation tasks associated with the current user, in ID order.
 
     Args:
+        cursor (Optional[int]): Only tasks after this task ID are listed. Use the X-Next-Cursor header of the previous page.
+        limit (Optional[int]): The maximum number of tasks to list. All tasks are listed when not given.
+        fields (Optional[str]): Comma separated columns to include, e.g. "id,target_language,status". Defaults to all.
+        format (str): "json" for a JSON array, or "ndjson" to stream one JSON object per line.
         current_user (User): The current authenticated user.
+        session (AsyncSession): The database session.
 
     Returns:
         List[TranslationTaskOut]: A list of translation tasks associated with the user.
+
+    Raises:
+        HTTPException: If an unknown field is requested.
     """
+    columns = TRANSLATION_TASK_FIELDS
+    if fields:
+        columns = tuple(field.strip() for field in fields.split(","))
+        unknown = set(columns) - set(TRANSLATION_TASK_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        # The ID is always included, it is the pagination cursor
+        if "id" not in columns:
+            columns = ("id",) + columns
+
+    if format == "ndjson":
+        async def lines():
+            async for row in stream_translation_tasks(current_user.id, after_id=cursor, limit=limit, fields=columns):
+                yield dumps(dict(row._mapping)) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
 
-    return await get_translation_tasks(current_user.id)
+    tasks = await get_translation_tasks(session, current_user.id, after_id=cursor, limit=limit, fields=columns)
+    headers = {}
+    if limit is not None and len(tasks) == limit:
+        headers["X-Next-Cursor"] = str(tasks[-1].id)
+
+    return JSONResponse([dict(task._mapping) for task in tasks], headers=headers)
 
 @translation_router.get("/tasks/{task_id}", response_model=TranslationTaskOut)
-async def get_task(task_id: int, current_user: User = Depends(get_current_user)):
+async def get_task(task_id: int, if_none_match: Optional[str] = Header(None),
+                   current_user: User = Depends(get_current_user),
+                   session: AsyncSession = Depends(get_session)):
     """
     Retrieves a translation task by its ID.
 
+    Finished tasks never change, so their rendered response is cached in process. Responses carry an ETag,
+    and a request whose If-None-Match matches it gets a 304 without a body.
+
     Args:
         task_id (int): The ID of the translation task.
+        if_none_match (Optional[str]): The ETags of the versions the client already has.
         current_user (User): The current authenticated user.
+        session (AsyncSession): The database session.
 
     Returns:
         TranslationTaskOut: The retrieved translation task.
@@ -58,20 +209,27 @@ async def get_task(task_id: int, current_user: User = Depends(get_current_user))
     Raises:
         HTTPException: If the translation task is not found or the user is not authorized to access it.
     """
+    cached = response_cache.get(("task", task_id))
+    if cached is None:
+        task = await get_translation_task_by_id(session, task_id=task_id)
 
-    task = await get_translation_task_by_id(task_id=task_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="Translation task not found")
+
+        cached = cached_response(task.user_id, TranslationTaskOut(**{field: getattr(task, field, None) for field in TranslationTaskOut.__fields__}))
+        # Queued tasks still change when a worker picks them up
+        if task.status == TaskStatus.DONE:
+            response_cache.set(("task", task_id), cached)
 
-    if not task:
-        raise HTTPException(status_code=404, detail="Translation task not found")
-    
     # Check if the task is owned by the current user
-    if task.user_id != current_user.id:
+    if cached.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to access this task")
-    
-    return task
+
+    return conditional_response(cached, if_none_match)
 
 @translation_router.post("/tasks/{task_id}/rate", response_model=RatingOut)
-async def rate_task(task_id: int, rating: RatingIn, current_user: User = Depends(get_current_user)):
+async def rate_task(task_id: int, rating: RatingIn, current_user: User = Depends(get_current_user),
+                    session: AsyncSession = Depends(get_session)):
     """
     Rates a translation task.
 
@@ -79,53 +237,80 @@ async def rate_task(task_id: int, rating: RatingIn, current_user: User = Depends
         task_id (int): The ID of the translation task to rate.
         rating (RatingIn): The input data for the rating.
         current_user (User): The current authenticated user.
+        session (AsyncSession): The database session.
 
     Returns:
-        None
+        RatingOut: The created rating.
 
     Raises:
-        HTTPException: If the translation task is not found, the user is not authorized to access it, or the task has already been rated.
+        HTTPException: If the current user has no such translation task, the task has not been completed, or the task has already been rated.
     """
-    task = await get_translation_task_by_id(task_id=task_id)
+    # Ownership, completion and uniqueness are all checked by the insert itself
+    new_rating = await create_translation_rating(session, rating=rating, task_id=task_id, user_id=current_user.id)
+    if new_rating:
+        response_cache.pop(("rating", task_id))
+        return new_rating
 
-    # Check if task exists
-    if not task:
+    # Nothing was inserted, find out why
+    task_and_rating = await get_task_with_rating(session, task_id=task_id, user_id=current_user.id)
+    if not task_and_rating:
         raise HTTPException(status_code=404, detail="Translation task not found")
-    
-    # Check if the task is owned by the current user
-    if task.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to access this task")
-    
-    # Check if task has already been rated
-    existing_rating = await get_rating_by_task_id(translation_id=task_id)
-    if existing_rating:
-        raise HTTPException(status_code=409, detail="Task has already been rated")
-    
-    return await create_translation_rating(rating=rating, task_id=task_id)
+
+    # Queued tasks can only be rated once translated
+    if task_and_rating.TranslationTask.status != TaskStatus.DONE:
+        raise HTTPException(status_code=409, detail="Translation task has not been completed")
+
+    raise HTTPException(status_code=409, detail="Task has already been rated")
 
 @translation_router.get("/tasks/{task_id}/rate")
-async def get_rating(task_id: int, current_user: User = Depends(get_current_user)):
+async def get_rating(task_id: int, if_none_match: Optional[str] = Header(None),
+                     current_user: User = Depends(get_current_user),
+                     session: AsyncSession = Depends(get_session)):
     """
     Retrieves the rating associated with a translation task.
 
+    The rendered response is cached in process for RESPONSE_CACHE_RATING_TTL seconds, and dropped when the
+    rating is created or deleted. Responses carry an ETag, and a request whose If-None-Match matches it gets
+    a 304 without a body.
+
     Args:
         task_id (int): The ID of the translation task.
+        if_none_match (Optional[str]): The ETags of the versions the client already has.
         current_user (User): The current authenticated user.
+        session (AsyncSession): The database session.
 
     Returns:
-        Optional[Rating]: The rating associated with the translation task, or None if not found.
+        Optional[Rating]: The rating associated with the translation task, or None if not rated.
+
+    Raises:
+        HTTPException: If the current user has no such translation task.
     """
 
-    return await get_rating_by_task_id(task_id)
+    cached = response_cache.get(("rating", task_id))
+    if cached is None:
+        task_and_rating = await get_task_with_rating(session, task_id=task_id, user_id=current_user.id)
+        if not task_and_rating:
+            raise HTTPException(status_code=404, detail="Translation task not found")
+
+        cached = cached_response(current_user.id, task_and_rating.Rating)
+        response_cache.set(("rating", task_id), cached, ttl=RESPONSE_CACHE_RATING_TTL)
+
+    # Other users' tasks look like missing ones
+    if cached.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Translation task not found")
+
+    return conditional_response(cached, if_none_match)
 
 @translation_router.delete("/tasks/{task_id}/rate")
-async def delete_rating(task_id: int, current_user: User = Depends(get_current_user)):
+async def delete_rating(task_id: int, current_user: User = Depends(get_current_user),
+                        session: AsyncSession = Depends(get_session)):
     """
     Deletes the rating associated with a translation task.
     
     Args:
         task_id (int): The ID of the translation task.
         current_user (User): The current authenticated user.
+        session (AsyncSession): The database session.
     
     Returns:
         Dict[str, Union[str, int]]: A dictionary indicating the status and message of the deletion.
@@ -134,9 +319,9 @@ async def delete_rating(task_id: int, current_user: User = Depends(get_current_u
         HTTPException: If the rating is not found.
     """
 
-    rating = await get_rating_by_task_id(task_id)
-    if not rating:
+    rating_id = await remove_rating(session, task_id=task_id, user_id=current_user.id)
+    response_cache.pop(("rating", task_id))
+    if not rating_id:
         raise HTTPException(status_code=404, detail="Rating not found")
     
-    await remove_rating(rating.id)
-    return {"status": "success", "message": f"Successfully deleted rating with id {rating.id}"}
+    return {"status": "success", "message": f"Successfully deleted rating with id {rating_id}"}
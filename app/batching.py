@@ -0,0 +1,119 @@
+from app.metrics import Histogram
+from app.providers import ProviderError, PROVIDER_MAX_BATCH_CHARS
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import os
+
+# Micro-batching settings. A window of 0 disables micro-batching.
+MICRO_BATCH_WINDOW_MS = float(os.environ.get("MICRO_BATCH_WINDOW_MS", 5))
+MICRO_BATCH_MAX_SIZE = int(os.environ.get("MICRO_BATCH_MAX_SIZE", 128))
+MICRO_BATCH_MAX_CHARS = int(os.environ.get("MICRO_BATCH_MAX_CHARS", PROVIDER_MAX_BATCH_CHARS))
+
+BatchTranslator = Callable[[List[str], Optional[str], str], Awaitable[List[Tuple[str, str]]]]
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.texts = []
+        self.futures = []
+        self.chars = 0
+        self.timer = None
+
+
+class MicroBatcher:
+    """
+    Merges concurrent single-text translations sharing a language pair into one provider call.
+
+    A request waits at most `window_ms` for others to join its batch. The batch is sent earlier
+    when it reaches `max_batch_size` texts or `max_chars` characters.
+    """
+
+    def __init__(self, translate_batch: BatchTranslator, window_ms: float = MICRO_BATCH_WINDOW_MS,
+                 max_batch_size: int = MICRO_BATCH_MAX_SIZE, max_chars: int = MICRO_BATCH_MAX_CHARS):
+        self.translate_batch = translate_batch
+        self.window_ms = window_ms
+        self.max_batch_size = max_batch_size
+        self.max_chars = max_chars
+        self._pending: Dict[Tuple[Optional[str], str], _PendingBatch] = {}
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.batch_chars = Histogram([100, 1000, 5000, 10000, 30000])
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(batch.texts) for batch in self._pending.values())
+
+    async def submit(self, text: str, source: Optional[str], target: str) -> Tuple[str, str]:
+        """
+        Queues a text for translation and waits for the result of its batch.
+
+        Args:
+            text (str): The text to translate.
+            source (Optional[str]): The source language, None to have the provider detect it.
+            target (str): The target language.
+
+        Returns:
+            Tuple[str, str]: The translated text and the (possibly detected) source language.
+        """
+        key = (source, target)
+
+        # A text that doesn't fit next to the ones already waiting starts a new batch
+        batch = self._pending.get(key)
+        if batch and batch.chars + len(text) > self.max_chars:
+            self._flush(key)
+
+        batch = self._pending.setdefault(key, _PendingBatch())
+        future = asyncio.get_running_loop().create_future()
+        batch.texts.append(text)
+        batch.futures.append(future)
+        batch.chars += len(text)
+
+        if len(batch.texts) >= self.max_batch_size or batch.chars >= self.max_chars:
+            self._flush(key)
+        elif batch.timer is None:
+            batch.timer = asyncio.get_running_loop().call_later(self.window_ms / 1000, self._flush, key)
+
+        return await future
+
+    def _flush(self, key: Tuple[Optional[str], str]):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+
+        if batch.timer is not None:
+            batch.timer.cancel()
+
+        self.batch_sizes.observe(len(batch.texts))
+        self.batch_chars.observe(batch.chars)
+        asyncio.ensure_future(self._dispatch(key, batch))
+
+    async def _dispatch(self, key: Tuple[Optional[str], str], batch: _PendingBatch):
+        source, target = key
+        try:
+            results = await self.translate_batch(batch.texts, source, target)
+            # zip() would leave the waiters past the end of a short result list waiting forever
+            if len(results) != len(batch.texts):
+                raise ProviderError(f"Provider returned {len(results)} translations for {len(batch.texts)} texts")
+        except Exception as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Waiters may have been cancelled (e.g. client disconnected) while the batch was in flight
+        for future, result in zip(batch.futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window_ms,
+            "max_batch_size": self.max_batch_size,
+            "max_chars": self.max_chars,
+            "queue_depth": self.queue_depth,
+            "batch_sizes": self.batch_sizes.snapshot(),
+            "batch_chars": self.batch_chars.snapshot(),
+        }
@@ -0,0 +1,154 @@
+from app.crud import blacklist_token, get_blacklisted_tokens, purge_expired_blacklisted_tokens, get_token_versions
+from app.database import async_session
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Dict, Optional
+import asyncio
+import hashlib
+import jwt
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds between syncs of the in-process blacklist with tokens blacklisted by other workers
+BLACKLIST_SYNC_INTERVAL = float(os.environ.get("BLACKLIST_SYNC_INTERVAL", 5))
+# Seconds between purges of expired entries from the blacklisted_tokens table
+BLACKLIST_PURGE_INTERVAL = float(os.environ.get("BLACKLIST_PURGE_INTERVAL", 3600))
+# Token version bumps re-read on every sync. Must exceed the token lifetime (ACCESS_TOKEN_EXPIRE_MINUTES),
+# since tokens issued before an older bump have expired anyway.
+TOKEN_VERSION_WINDOW = float(os.environ.get("TOKEN_VERSION_WINDOW", 3600))
+
+
+def token_digest(token: str) -> str:
+    """Returns the fixed-size key a token is blacklisted under."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def token_expiry(token: str) -> Optional[float]:
+    """
+    Reads the expiration time of a JWT without verifying it.
+
+    Returns:
+        Optional[float]: The `exp` claim as a UNIX timestamp, or None if the token has none or can't be decoded.
+    """
+    try:
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.PyJWTError:
+        return None
+    return float(exp) if exp is not None else None
+
+
+class TokenBlacklist:
+    """
+    In-process copy of the blacklisted_tokens table, so checking a token needs no database query.
+
+    Tokens are kept by digest and dropped once their JWT expires, since expired tokens are rejected anyway.
+    Tokens blacklisted by other workers are picked up by a periodic sync, so they may stay usable there for up
+    to BLACKLIST_SYNC_INTERVAL seconds. Each sync reloads every unexpired row: IDs don't become visible in commit
+    order, so an ID cursor would skip rows committed late. Expired rows are purged from the table every
+    BLACKLIST_PURGE_INTERVAL seconds, which keeps the reload small.
+
+    The current token version of the users whose tokens were revoked all at once (users.token_version) is
+    synced the same way, re-reading every bump of the last TOKEN_VERSION_WINDOW seconds: tokens issued under
+    an older version are rejected.
+    """
+
+    def __init__(self, sync_interval: float = BLACKLIST_SYNC_INTERVAL, purge_interval: float = BLACKLIST_PURGE_INTERVAL,
+                 version_window: float = TOKEN_VERSION_WINDOW):
+        self.sync_interval = sync_interval
+        self.purge_interval = purge_interval
+        self.version_window = version_window
+        self._digests: Dict[str, float] = {}
+        self._versions: Dict[int, int] = {}
+        self._tasks = []
+
+    async def revoke(self, session: AsyncSession, token: str):
+        """
+        Blacklists a token in the database and in this process.
+
+        The token must have been verified: its expiry is read without checking the signature, and is what
+        eventually drops it from the blacklist.
+
+        Args:
+            session (AsyncSession): The database session.
+            token (str): The token to blacklist.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: If the token has no expiry.
+        """
+        digest = token_digest(token)
+        exp = token_expiry(token)
+        if exp is None:
+            raise ValueError("Only expiring tokens can be blacklisted")
+        await blacklist_token(session, digest, datetime.utcfromtimestamp(exp))
+        self._digests[digest] = exp
+
+    def __contains__(self, token: str) -> bool:
+        return token_digest(token) in self._digests
+
+    def revoke_user(self, user_id: int, token_version: int):
+        """Rejects the user's tokens issued before `token_version`, once it has been stored in the database."""
+        self._versions[user_id] = max(token_version, self._versions.get(user_id, 0))
+
+    def is_current(self, user_id: int, token_version: int) -> bool:
+        """Tells whether a token issued under `token_version` hasn't been revoked by a version bump."""
+        return token_version >= self._versions.get(user_id, 0)
+
+    def purge(self):
+        """Drops expired tokens."""
+        now = time.time()
+        expired = [digest for digest, exp in self._digests.items() if exp <= now]
+        for digest in expired:
+            del self._digests[digest]
+
+    async def sync(self):
+        """Reloads the blacklisted tokens and the recently bumped token versions."""
+        async with async_session() as session:
+            rows = await get_blacklisted_tokens(session)
+            versions = await get_token_versions(session, window_seconds=self.version_window)
+        # Added to, not replaced: tokens revoked here during the query stay blacklisted
+        for row in rows:
+            # expires_at is stored as naive UTC
+            self._digests[row.token_hash] = (row.expires_at - datetime(1970, 1, 1)).total_seconds()
+        for row in versions:
+            self.revoke_user(row.id, row.token_version)
+        self.purge()
+
+    async def purge_expired(self):
+        """Deletes expired entries from the blacklisted_tokens table."""
+        async with async_session() as session:
+            await purge_expired_blacklisted_tokens(session)
+
+    async def start(self):
+        try:
+            await self.sync()
+        except Exception:
+            # Not fatal, like the other warm-ups: a brief database outage during a rolling restart shouldn't
+            # stop every worker from starting. The periodic sync catches up once the database is back.
+            logger.warning("Could not load the token blacklist, retrying in %ss", self.sync_interval, exc_info=True)
+        self._tasks = [
+            asyncio.ensure_future(self._every(self.sync_interval, self.sync)),
+            asyncio.ensure_future(self._every(self.purge_interval, self.purge_expired)),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _every(self, interval: float, job):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await job()
+            except Exception:
+                logger.exception("Token blacklist maintenance failed")
+
+
+token_blacklist = TokenBlacklist()
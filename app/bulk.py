@@ -0,0 +1,331 @@
+from app.database import async_engine
+from app.models import Base
+from sqlalchemy import BigInteger, DateTime, Integer, String
+from typing import AsyncIterator, List, Optional
+import asyncio
+import csv
+import os
+import zlib
+
+# Chunks read ahead of the client during an export, bounding the memory an export holds
+EXPORT_BUFFER_CHUNKS = int(os.environ.get("EXPORT_BUFFER_CHUNKS", 16))
+# Rows per Parquet row group
+EXPORT_PARQUET_ROWS = int(os.environ.get("EXPORT_PARQUET_ROWS", 50000))
+EXPORT_GZIP_LEVEL = int(os.environ.get("EXPORT_GZIP_LEVEL", 6))
+
+# Exportable tables: their name, columns and the sequence of their IDs
+TABLES = {
+    "tasks": {
+        "table": "translation_tasks",
+        "columns": ("id", "user_id", "source_language", "target_language", "text_to_translate", "translated_text",
+                    "status", "text_digest", "created_at"),
+        "sequence": "translation_task_id_seq",
+    },
+    "ratings": {
+        "table": "ratings",
+        "columns": ("id", "translation_id", "rating", "feedback"),
+        "sequence": "ratings_id_seq",
+    },
+}
+
+# Imports go through a staging table and are merged with a single INSERT ... SELECT, returning the number of rows imported.
+# Rows are skipped if their ID is taken, or if they point to a user or task that doesn't exist.
+MERGES = {
+    "tasks": """
+        WITH imported AS (
+            INSERT INTO translation_tasks (id, user_id, source_language, target_language, text_to_translate,
+                                           translated_text, status, text_digest, created_at)
+            SELECT COALESCE(s.id, nextval('translation_task_id_seq')), s.user_id, s.source_language, s.target_language,
+                   s.text_to_translate, s.translated_text, COALESCE(s.status, 'done'), s.text_digest, COALESCE(s.created_at, now())
+            FROM import_staging s
+            WHERE s.user_id IS NULL OR EXISTS (SELECT 1 FROM users WHERE users.id = s.user_id)
+            ON CONFLICT DO NOTHING
+            RETURNING 1
+        )
+        SELECT count(*) FROM imported
+    """,
+    # Imported ratings are added to rating_stats in the same statement
+    "ratings": """
+        WITH imported AS (
+            INSERT INTO ratings (id, translation_id, rating, feedback)
+            SELECT COALESCE(s.id, nextval('ratings_id_seq')), s.translation_id, s.rating, s.feedback
+            FROM import_staging s
+            JOIN translation_tasks ON translation_tasks.id = s.translation_id
+            WHERE s.rating BETWEEN 1 AND 5
+            ON CONFLICT DO NOTHING
+            RETURNING translation_id, rating
+        ), stats AS (
+            INSERT INTO rating_stats
+            SELECT t.source_language, t.target_language, count(*), sum(i.rating),
+                   count(*) FILTER (WHERE i.rating = 1), count(*) FILTER (WHERE i.rating = 2),
+                   count(*) FILTER (WHERE i.rating = 3), count(*) FILTER (WHERE i.rating = 4),
+                   count(*) FILTER (WHERE i.rating = 5)
+            FROM imported i
+            JOIN translation_tasks t ON t.id = i.translation_id
+            WHERE t.source_language IS NOT NULL
+            GROUP BY t.source_language, t.target_language
+            ON CONFLICT (source_language, target_language) DO UPDATE SET
+                rating_count = rating_stats.rating_count + EXCLUDED.rating_count,
+                rating_sum = rating_stats.rating_sum + EXCLUDED.rating_sum,
+                rating_1 = rating_stats.rating_1 + EXCLUDED.rating_1,
+                rating_2 = rating_stats.rating_2 + EXCLUDED.rating_2,
+                rating_3 = rating_stats.rating_3 + EXCLUDED.rating_3,
+                rating_4 = rating_stats.rating_4 + EXCLUDED.rating_4,
+                rating_5 = rating_stats.rating_5 + EXCLUDED.rating_5
+        )
+        SELECT count(*) FROM imported
+    """,
+}
+
+# COPY options that pass one JSON document per line through untouched: these control characters are
+# always escaped inside JSON, so no field is ever quoted or split
+_RAW_LINES = {"format": "csv", "delimiter": "\x02", "quote": "\x01"}
+
+
+class BulkImportError(ValueError):
+    """Raised when an import file can't be loaded."""
+
+
+def _select(table: str, after_id: Optional[int]) -> str:
+    spec = TABLES[table]
+    return f"SELECT {', '.join(spec['columns'])} FROM {spec['table']} WHERE id > {int(after_id or 0)} ORDER BY id"
+
+
+async def _copy_out(query: str, **copy_options) -> AsyncIterator[bytes]:
+    """
+    Streams the output of COPY (query) TO STDOUT.
+
+    The driver pushes chunks into a bounded queue, so a slow client pauses the COPY instead of
+    letting chunks pile up in memory.
+    """
+    queue = asyncio.Queue(maxsize=EXPORT_BUFFER_CHUNKS)
+    done = object()
+
+    async with async_engine.connect() as connection:
+        driver = (await connection.get_raw_connection()).connection.driver_connection
+
+        async def output(chunk):
+            # The driver reuses its buffer
+            await queue.put(bytes(chunk))
+
+        async def produce():
+            try:
+                await driver.copy_from_query(query, output=output, **copy_options)
+            finally:
+                await queue.put(done)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is done:
+                    break
+                yield chunk
+            # Raises the COPY's error, if any
+            await producer
+        finally:
+            if not producer.done():
+                # The client went away mid-COPY, the connection can't be reused
+                producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
+                await connection.invalidate()
+
+
+async def _parquet(table: str, after_id: Optional[int]) -> AsyncIterator[bytes]:
+    """
+    Streams a table as Parquet, one row group of EXPORT_PARQUET_ROWS rows at a time.
+
+    Parquet is columnar, so rows are read from a server-side cursor and converted per row group
+    rather than passed through from COPY.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    class Sink:
+        # Collects what the writer produces until it is sent to the client
+        def __init__(self):
+            self.chunks = []
+            self.position = 0
+            self.closed = False
+
+        def write(self, data):
+            self.chunks.append(bytes(data))
+            self.position += len(data)
+
+        def tell(self):
+            return self.position
+
+        def flush(self):
+            pass
+
+        def close(self):
+            self.closed = True
+
+        def drain(self) -> bytes:
+            data = b"".join(self.chunks)
+            self.chunks = []
+            return data
+
+    columns = TABLES[table]["columns"]
+    # Column types come from the model, not from the first row group: a nullable column that is all NULL
+    # there would get Arrow's null type, and later row groups holding values couldn't be written
+    arrow_types = {Integer: pa.int64(), BigInteger: pa.int64(), String: pa.string(), DateTime: pa.timestamp("us")}
+    model_columns = Base.metadata.tables[TABLES[table]["table"]].columns
+    schema = pa.schema([
+        pa.field(column, arrow_types[type(model_columns[column].type)], nullable=model_columns[column].nullable)
+        for column in columns
+    ])
+    sink = Sink()
+    # Opened up front, so an empty table still exports as a valid file
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+
+    async with async_engine.connect() as connection:
+        driver = (await connection.get_raw_connection()).connection.driver_connection
+        async with driver.transaction():
+            cursor = await driver.cursor(_select(table, after_id))
+            while True:
+                records = await cursor.fetch(EXPORT_PARQUET_ROWS)
+                if not records:
+                    break
+                batch = pa.Table.from_pydict({column: [record[column] for record in records] for column in columns},
+                                             schema=schema)
+                writer.write_table(batch)
+                yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
+
+
+async def _gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_rows(table: str, format: str, gzip: bool = False, after_id: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Streams all the rows of a table, in ID order, with constant memory.
+
+    CSV and NDJSON are produced by Postgres itself with COPY ... TO STDOUT.
+
+    Args:
+        table (str): "tasks" or "ratings".
+        format (str): "csv" (with a header line), "ndjson" or "parquet". Parquet needs pyarrow.
+        gzip (bool): Whether to gzip the output on the fly. Parquet is always compressed internally.
+        after_id (Optional[int]): Only rows with an ID greater than this one are exported, to resume an export.
+
+    Returns:
+        AsyncIterator[bytes]: The file contents, in chunks.
+    """
+    query = _select(table, after_id)
+    if format == "parquet":
+        return _parquet(table, after_id)
+    if format == "ndjson":
+        chunks = _copy_out(f"SELECT row_to_json(t) FROM ({query}) t", **_RAW_LINES)
+    else:
+        chunks = _copy_out(query, format="csv", header=True)
+    return _gzip(chunks) if gzip else chunks
+
+
+async def _gunzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # wbits=47 accepts both gzip and zlib headers
+    decompressor = zlib.decompressobj(47)
+    async for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+async def _csv_header(chunks: AsyncIterator[bytes]):
+    """
+    Reads the header line of a CSV stream.
+
+    Returns:
+        Tuple[List[str], AsyncIterator[bytes]]: The column names and the whole stream, header included.
+    """
+    buffered = b""
+    async for chunk in chunks:
+        buffered += chunk
+        if b"\n" in buffered:
+            break
+
+    header = buffered.split(b"\n", 1)[0].decode("utf-8").strip("\r")
+    columns = next(csv.reader([header]), [])
+
+    async def replay():
+        yield buffered
+        async for chunk in chunks:
+            yield chunk
+
+    return columns, replay()
+
+
+async def import_rows(table: str, format: str, chunks: AsyncIterator[bytes], gzip: bool = False) -> dict:
+    """
+    Loads rows into a table with COPY ... FROM STDIN, in a single transaction.
+
+    Rows are copied into a temporary staging table, then merged into the table with one INSERT ... SELECT.
+    Rows whose ID is already taken, or that point to a missing user or task, are skipped. Rows without an
+    ID get a new one. Imported tasks only join the translation memory if they carry their text digest.
+
+    Args:
+        table (str): "tasks" or "ratings".
+        format (str): "csv" (the header line names the columns) or "ndjson" (one JSON object per line).
+        chunks (AsyncIterator[bytes]): The file contents.
+        gzip (bool): Whether the contents are gzipped.
+
+    Returns:
+        dict: The number of rows read and the number of rows imported.
+
+    Raises:
+        BulkImportError: If the file names unknown columns or can't be loaded.
+    """
+    spec = TABLES[table]
+    if gzip:
+        chunks = _gunzip(chunks)
+
+    columns: List[str] = list(spec["columns"])
+    if format == "csv":
+        (columns, chunks) = await _csv_header(chunks)
+        unknown = set(columns) - set(spec["columns"])
+        if unknown or not columns:
+            raise BulkImportError(f"Unknown columns: {', '.join(sorted(unknown))}" if unknown else "Missing CSV header")
+
+    import asyncpg
+
+    async with async_engine.connect() as connection:
+        driver = (await connection.get_raw_connection()).connection.driver_connection
+        try:
+            async with driver.transaction():
+                # No constraints or defaults: missing values are filled in by the merge
+                await driver.execute(
+                    f"CREATE TEMP TABLE import_staging ON COMMIT DROP AS SELECT {', '.join(spec['columns'])} "
+                    f"FROM {spec['table']} WITH NO DATA")
+
+                if format == "csv":
+                    status = await driver.copy_to_table("import_staging", source=chunks, columns=columns,
+                                                        format="csv", header=True)
+                else:
+                    await driver.execute("CREATE TEMP TABLE import_lines (line text) ON COMMIT DROP")
+                    status = await driver.copy_to_table("import_lines", source=chunks, **_RAW_LINES)
+                    await driver.execute(
+                        "INSERT INTO import_staging SELECT (json_populate_record(NULL::import_staging, line::json)).* "
+                        "FROM import_lines WHERE line <> ''")
+
+                imported = await driver.fetchval(MERGES[table])
+
+                # Keep the sequence ahead of imported IDs
+                await driver.execute(
+                    f"SELECT setval('{spec['sequence']}', max_id) FROM (SELECT max(id) AS max_id FROM {spec['table']}) m "
+                    f"WHERE max_id > (SELECT last_value FROM {spec['sequence']})")
+        except (asyncpg.PostgresError, UnicodeDecodeError, zlib.error) as e:
+            raise BulkImportError(f"Import failed: {e}") from e
+
+    # The COPY status looks like "COPY 42"
+    return {"rows": int(status.split()[-1]), "imported": imported}
@@ -0,0 +1,135 @@
+from app.cache import LRUCache
+from app.languages import text_key
+from app.utils import translate_text
+from typing import Iterator, Optional, Tuple
+import asyncio
+import os
+import re
+
+# Texts longer than this are split into chunks of at most this many characters
+DOCUMENT_CHUNK_CHARS = int(os.environ.get("DOCUMENT_CHUNK_CHARS", 5000))
+# Chunks of one document translated concurrently
+DOCUMENT_CONCURRENCY = int(os.environ.get("DOCUMENT_CONCURRENCY", 4))
+# Translated chunks kept so a retried document only redoes the chunks that failed
+CHUNK_CACHE_SIZE = int(os.environ.get("CHUNK_CACHE_SIZE", 10000))
+CHUNK_CACHE_TTL = float(os.environ.get("CHUNK_CACHE_TTL", 3600))
+
+chunk_cache = LRUCache(maxsize=CHUNK_CACHE_SIZE, ttl=CHUNK_CACHE_TTL)
+
+_SENTENCE_END = re.compile(r"[.!?。！？][\"')\]]*\s+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _last_match_end(pattern: re.Pattern, text: str, start: int, end: int) -> int:
+    last = -1
+    for match in pattern.finditer(text, start, end):
+        last = match.end()
+    return last
+
+
+def iter_chunks(text: str, max_chars: int = DOCUMENT_CHUNK_CHARS) -> Iterator[str]:
+    """
+    Splits text into chunks of at most `max_chars` characters, lazily.
+
+    Cuts are made on paragraph boundaries when possible, then on sentence boundaries, then on whitespace.
+    Chunks keep their surrounding whitespace, so joining them gives back the original text.
+
+    Args:
+        text (str): The text to split.
+        max_chars (int): The maximum length of a chunk.
+
+    Yields:
+        str: The next chunk.
+    """
+    start = 0
+    while start < len(text):
+        end = start + max_chars
+        if end >= len(text):
+            yield text[start:]
+            return
+
+        # Prefer natural boundaries, but not ones that would leave a tiny chunk
+        min_cut = start + max_chars // 2
+        cut = text.rfind("\n\n", start, end)
+        cut = cut + 2 if cut >= min_cut else -1
+        if cut < 0:
+            cut = _last_match_end(_SENTENCE_END, text, min_cut, end)
+        if cut < 0:
+            cut = _last_match_end(_WHITESPACE, text, start + 1, end)
+        if cut <= start:
+            cut = end
+
+        yield text[start:cut]
+        start = cut
+
+
+async def _translate_chunk(source: Optional[str], target: str, chunk: str) -> Tuple[str, str]:
+    # Leave surrounding whitespace out of the provider call and put it back afterwards
+    core = chunk.strip()
+    if not core:
+        return (chunk, source)
+
+    # Keyed by digest, so the cache doesn't hold a copy of every chunk on top of its translation
+    key = (source, target, text_key(core))
+    cached = chunk_cache.get(key)
+    if cached is None:
+        cached = await translate_text(source, target, core)
+        chunk_cache.set(key, cached)
+
+    (translated_core, source_language) = cached
+    leading = chunk[:len(chunk) - len(chunk.lstrip())]
+    trailing = chunk[len(chunk.rstrip()):]
+    return (leading + translated_core + trailing, source_language)
+
+
+async def translate_document(source: Optional[str], target: str, text: str,
+                             max_chars: int = DOCUMENT_CHUNK_CHARS,
+                             concurrency: int = DOCUMENT_CONCURRENCY) -> Tuple[str, str]:
+    """
+    Translates a text too large for a single provider call.
+
+    The text is split into chunks that are translated concurrently, at most `concurrency` at a time,
+    and reassembled in order. Chunks are produced lazily as slots free up. When the source language
+    is not given, it is detected on the first chunk and reused for the others.
+
+    Args:
+        source (Optional[str]): The source language, None to have the provider detect it.
+        target (str): The target language.
+        text (str): The text to translate.
+        max_chars (int): The maximum length of a chunk.
+        concurrency (int): The maximum number of chunks translated at the same time.
+
+    Returns:
+        Tuple[str, str]: The translated text and the (possibly detected) source language.
+    """
+    chunks = iter_chunks(text, max_chars)
+    translated = []
+
+    first = next(chunks, "")
+    (translated_first, source) = await _translate_chunk(source, target, first)
+    translated.append(translated_first)
+
+    async def translate_at(index, chunk):
+        translated[index] = (await _translate_chunk(source, target, chunk))[0]
+
+    in_flight = set()
+    error = None
+    for chunk in chunks:
+        translated.append(None)
+        in_flight.add(asyncio.ensure_future(translate_at(len(translated) - 1, chunk)))
+
+        if len(in_flight) >= concurrency:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            error = next((task.exception() for task in done if task.exception()), None)
+            if error:
+                break
+
+    # Let the chunks in flight finish so a retry finds them cached
+    if in_flight:
+        done, _ = await asyncio.wait(in_flight)
+        error = error or next((task.exception() for task in done if task.exception()), None)
+
+    if error:
+        raise error
+
+    return ("".join(translated), source)
@@ -1,204 +1,705 @@
 from sqlalchemy.future import select
+from sqlalchemy import insert, update, delete, or_, and_, func, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models import User, TranslationTaskIn, TranslationTaskOut, TranslationTask, BlacklistedToken, Rating, RatingIn, RatingOut
-from app.database import async_engine
+from sqlalchemy.orm import aliased
+from app.models import User, TranslationTaskIn, TranslationTaskOut, TranslationTask, TaskStatus, BlacklistedToken, Rating, RatingIn, RatingOut, RatingStats
+from app.database import async_session
+from app.metrics import instrument_crud
 
 
-async def create_user(username: str, hashed_password: str):
+@instrument_crud
+async def create_user(session: AsyncSession, username: str, hashed_password: str):
     """
     Creates a new user with the given username and hashed password.
 
     Args:
+        session (AsyncSession): The database session.
         username (str): The username of the user.
         hashed_password (str): The hashed password of the user.
 
     Returns:
         None
     """
-    # We are using sqlalchemy's AsyncSession instead of databases' raw SQL constructs to leverage the benefits of ORM
-    async with AsyncSession(async_engine) as session:
-        new_user = User(username=username, hashed_password=hashed_password)
-        session.add(new_user)
-        await session.commit()
+    new_user = User(username=username, hashed_password=hashed_password)
+    session.add(new_user)
+    await session.commit()
 
 
-async def get_user(username: str):
+@instrument_crud
+async def get_user(session: AsyncSession, username: str):
     """
     Retrieves a user with the given username.
 
     Args:
+        session (AsyncSession): The database session.
         username (str): The username of the user to retrieve.
 
     Returns:
         Optional[User]: The user with the given username, or None if not found.
     """
-    async with AsyncSession(async_engine) as session:
-        result = await session.execute(select(User).filter_by(username=username))
-        return result.scalar()
+    result = await session.execute(select(User).filter_by(username=username))
+    return result.scalar()
 
 # Get a user by ID
-async def get_user_by_id(user_id: int):
+@instrument_crud
+async def get_user_by_id(session: AsyncSession, user_id: int):
     """
     Retrieves a user with the given user ID.
 
     Args:
+        session (AsyncSession): The database session.
         user_id (int): The ID of the user to retrieve.
 
     Returns:
         Optional[User]: The user with the given ID, or None if not found.
     """
-    async with AsyncSession(async_engine) as session:
-        result = await session.execute(select(User).filter_by(id=user_id))
-        return result.scalar()
+    result = await session.execute(select(User).filter_by(id=user_id))
+    return result.scalar()
     
-async def blacklist_token(token: str):
+@instrument_crud
+async def update_user_password(session: AsyncSession, user_id: int, hashed_password: str):
+    """
+    Changes a user's password and bumps their token version, revoking every token issued so far.
+
+    Args:
+        session (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+        hashed_password (str): The new hashed password.
+
+    Returns:
+        Optional[int]: The new token version, or None if the user doesn't exist.
+    """
+    result = await session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(hashed_password=hashed_password, token_version=func.nextval("token_version_seq"),
+                token_version_changed_at=func.now())
+        .returning(User.token_version)
+        .execution_options(synchronize_session=False)
+    )
+    token_version = result.scalar()
+    await session.commit()
+    return token_version
+
+@instrument_crud
+async def get_token_versions(session: AsyncSession, window_seconds: float):
+    """
+    Retrieves the users whose tokens were revoked recently.
+
+    Args:
+        session (AsyncSession): The database session.
+        window_seconds (float): How far back to look, in seconds.
+
+    Returns:
+        List[Row]: The id and token_version of each user.
+    """
+    result = await session.execute(
+        select(User.id, User.token_version)
+        .where(User.token_version_changed_at > func.now() - timedelta(seconds=window_seconds))
+    )
+    return result.all()
+
+@instrument_crud
+async def blacklist_token(session: AsyncSession, token_hash: str, expires_at: datetime):
     """
     Blacklists a token.
 
     Args:
-        token (str): The token to be blacklisted.
+        session (AsyncSession): The database session.
+        token_hash (str): The SHA-256 hex digest of the token to be blacklisted.
+        expires_at (datetime): When the token expires (UTC).
 
     Returns:
         None
     """
-    async with AsyncSession(async_engine) as session:
-        new_token = BlacklistedToken(token=token)
-        session.add(new_token)
-        await session.commit()
+    # Logging out twice with the same token is not an error
+    await session.execute(
+        pg_insert(BlacklistedToken)
+        .values(token_hash=token_hash, expires_at=expires_at)
+        .on_conflict_do_nothing(index_elements=[BlacklistedToken.token_hash])
+    )
+    await session.commit()
+
+@instrument_crud
+async def get_blacklisted_tokens(session: AsyncSession):
+    """
+    Retrieves all the unexpired blacklisted tokens.
 
-async def is_token_blacklisted(token: str):
+    Args:
+        session (AsyncSession): The database session.
+
+    Returns:
+        List[Row]: The token_hash and expires_at of each blacklisted token.
+    """
+    result = await session.execute(
+        select(BlacklistedToken.token_hash, BlacklistedToken.expires_at)
+        .where(BlacklistedToken.expires_at > datetime.utcnow())
+    )
+    return result.all()
+
+@instrument_crud
+async def is_token_blacklisted(session: AsyncSession, token_hash: str):
     """
     Checks if a token is blacklisted.
 
     Args:
-        token (str): The token to check.
+        session (AsyncSession): The database session.
+        token_hash (str): The SHA-256 hex digest of the token to check.
 
     Returns:
         bool: True if the token is blacklisted, False otherwise.
     """
-    async with AsyncSession(async_engine) as session:
-        result = await session.execute(select(BlacklistedToken).filter_by(token=token))
-        return bool(result.scalar())
+    result = await session.execute(select(BlacklistedToken.id).filter_by(token_hash=token_hash))
+    return bool(result.scalar())
+
+@instrument_crud
+async def purge_expired_blacklisted_tokens(session: AsyncSession):
+    """
+    Deletes blacklisted tokens that have expired, and those stored without an expiry by older versions.
+
+    Args:
+        session (AsyncSession): The database session.
+
+    Returns:
+        int: The number of deleted entries.
+    """
+    result = await session.execute(
+        delete(BlacklistedToken)
+        .where(or_(BlacklistedToken.expires_at.is_(None), BlacklistedToken.expires_at <= datetime.utcnow()))
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return result.rowcount
 
     
 # Create a new translation task
-async def create_translation_task(user_id: int, task: TranslationTaskIn, source: str, translated_text: str):
+@instrument_crud
+async def create_translation_task(session: AsyncSession, user_id: int, task: TranslationTaskIn, source: str, translated_text: str, text_digest: str = None,
+                                  status: str = TaskStatus.DONE):
     """
     Creates a translation task for a user.
 
     Args:
+        session (AsyncSession): The database session.
         user_id (int): The ID of the user.
         task (TranslationTaskIn): The input data for the translation task.
+        source (str): The source language of the text.
+        translated_text (str): The translated text.
+        text_digest (str): The translation memory key of the task.
+        status (str): The task status. Queued tasks are created as pending, without a translation.
 
     Returns:
         TranslationTaskOut: The created translation task.
 
     """
-    async with AsyncSession(async_engine) as session:
-        new_translation_task = TranslationTask(user_id=user_id, source_language=source,
-                                               target_language=task.target_language, text_to_translate=task.text_to_translate, translated_text=translated_text)
-        session.add(new_translation_task)
-        await session.commit()
-        await session.refresh(new_translation_task)  # Refresh to get any updated attributes from the DB
+    new_translation_task = TranslationTask(user_id=user_id, source_language=source,
+                                           target_language=task.target_language, text_to_translate=task.text_to_translate, translated_text=translated_text,
+                                           text_digest=text_digest, status=status)
+    session.add(new_translation_task)
+    await session.commit()  # Attributes stay loaded after commit (expire_on_commit=False), no refresh needed
+
+
+    # Convert the ORM object to the Pydantic model, TranslationTaskOut.from_orm is depracated
+    return TranslationTaskOut(
+        id=new_translation_task.id,
+        user_id=new_translation_task.user_id,
+        source_language=new_translation_task.source_language,
+        target_language=new_translation_task.target_language,
+        text_to_translate=new_translation_task.text_to_translate,
+        translated_text=new_translation_task.translated_text,
+        status=new_translation_task.status
+    )
+
+# Most parameters a single statement can bind
+MAX_BIND_PARAMETERS = 32767
+
+@instrument_crud
+async def create_translation_tasks(session: AsyncSession, user_id: int, tasks: List[dict]):
+    """
+    Creates several translation tasks for a user with as few multi-row INSERTs as possible.
 
+    Args:
+        session (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+        tasks (List[dict]): The column values of each task (source_language, target_language,
+            text_to_translate, translated_text and text_digest).
 
-        # Convert the ORM object to the Pydantic model, TranslationTaskOut.from_orm is depracated
-        return TranslationTaskOut(
-            id=new_translation_task.id,
-            user_id=new_translation_task.user_id,
-            source_language=new_translation_task.source_language,
-            target_language=new_translation_task.target_language,
-            text_to_translate=new_translation_task.text_to_translate,
-            translated_text=new_translation_task.translated_text
+    Returns:
+        List[TranslationTaskOut]: The created translation tasks, in input order.
+    """
+    if not tasks:
+        return []
+
+    # Ids are drawn up front: RETURNING isn't guaranteed to follow the VALUES order
+    ids = sorted((await session.execute(
+        select(TranslationTask.id.default.next_value()).select_from(func.generate_series(1, len(tasks)))
+    )).scalars().all())
+    rows = [dict(task, id=task_id, user_id=user_id) for task_id, task in zip(ids, tasks)]
+
+    # Split so no INSERT binds more parameters than the Postgres protocol allows. Columns left out of the rows
+    # can still be bound, with their Python-side default.
+    chunk_size = MAX_BIND_PARAMETERS // len(TranslationTask.__table__.columns)
+    for start in range(0, len(rows), chunk_size):
+        await session.execute(insert(TranslationTask).values(rows[start:start + chunk_size]))
+    await session.commit()
+
+    return [
+        TranslationTaskOut(
+            id=task_id,
+            user_id=user_id,
+            source_language=row["source_language"],
+            target_language=row["target_language"],
+            text_to_translate=row["text_to_translate"],
+            translated_text=row["translated_text"]
         )
-
-async def get_translation_tasks(user_id: int):
+        for task_id, row in zip(ids, rows)
+    ]
+
+# Columns that can be requested when listing translation tasks
+TRANSLATION_TASK_FIELDS = ("id", "source_language", "target_language", "text_to_translate", "translated_text", "status")
+
+def _translation_tasks_query(user_id: int, after_id: Optional[int], limit: Optional[int], fields: Sequence[str]):
+    query = (
+        select(*(getattr(TranslationTask, field) for field in fields))
+        .where(TranslationTask.user_id == user_id)
+        .order_by(TranslationTask.id)
+    )
+    if after_id is not None:
+        query = query.where(TranslationTask.id > after_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+@instrument_crud
+async def get_translation_tasks(session: AsyncSession, user_id: int, after_id: Optional[int] = None, limit: Optional[int] = None,
+                                fields: Sequence[str] = TRANSLATION_TASK_FIELDS):
     """
-    Retrieves all the translation tasks associated with a user.
+    Retrieves the translation tasks associated with a user, in ID order.
+
+    Pages are selected with a keyset (cursor) on the task ID, so fetching a page costs the same wherever it is.
 
     Args:
+        session (AsyncSession): The database session.
         user_id (int): The ID of the user.
+        after_id (Optional[int]): Only tasks with an ID greater than this one are returned.
+        limit (Optional[int]): The maximum number of tasks to return.
+        fields (Sequence[str]): The columns to fetch, a subset of TRANSLATION_TASK_FIELDS.
 
     Returns:
-        Optional[List[TranslationTask]]: A list of translation tasks associated with the user, or None if the user does not exist.
+        List[Row]: The requested columns of the user's translation tasks.
     """
-    # Fetch user 
-    user = await get_user_by_id(user_id=user_id)
-    if not user:
-        return None
-    
-    # Fetch user's associated translations
-    async with AsyncSession(async_engine) as session:
-        result = await session.execute(select(TranslationTask).filter_by(user_id=user.id))
-        return result.scalars().all()
+    result = await session.execute(_translation_tasks_query(user_id, after_id, limit, fields))
+    return result.all()
 
-async def get_translation_task_by_id(task_id: int):
+async def stream_translation_tasks(user_id: int, after_id: Optional[int] = None, limit: Optional[int] = None,
+                                   fields: Sequence[str] = TRANSLATION_TASK_FIELDS, batch_size: int = 1000):
+    """
+    Streams the translation tasks associated with a user, in ID order, from a server-side cursor.
+
+    Only `batch_size` rows are held in memory at a time.
+
+    Args:
+        user_id (int): The ID of the user.
+        after_id (Optional[int]): Only tasks with an ID greater than this one are returned.
+        limit (Optional[int]): The maximum number of tasks to return.
+        fields (Sequence[str]): The columns to fetch, a subset of TRANSLATION_TASK_FIELDS.
+        batch_size (int): The number of rows fetched from the cursor at a time.
+
+    Yields:
+        Row: The requested columns of the next translation task.
+    """
+    # Uses its own session: the server-side cursor holds a connection for as long as the stream is consumed
+    async with async_session() as session:
+        result = await session.stream(
+            _translation_tasks_query(user_id, after_id, limit, fields).execution_options(yield_per=batch_size))
+        async for row in result:
+            yield row
+
+@instrument_crud
+async def get_translation_task_by_id(session: AsyncSession, task_id: int):
     """
     Retrieves a translation task with the given ID.
 
     Args:
+        session (AsyncSession): The database session.
         task_id (int): The ID of the translation task to retrieve.
 
     Returns:
         Optional[TranslationTask]: The translation task with the given ID, or None if not found.
     """
-    async with AsyncSession(async_engine) as session:
-        result = await session.execute(select(TranslationTask).filter_by(id=task_id))
-        return result.scalar()
+    result = await session.execute(select(TranslationTask).filter_by(id=task_id))
+    return result.scalar()
+
+
+@instrument_crud
+async def get_translation_by_digest(session: AsyncSession, text_digest: str):
+    """
+    Retrieves a past translation task with the given translation memory key.
+
+    Args:
+        session (AsyncSession): The database session.
+        text_digest (str): The translation memory key.
+
+    Returns:
+        Optional[TranslationTask]: A translation task with the given key, or None if not found.
+    """
+    result = await session.execute(select(TranslationTask).filter_by(text_digest=text_digest).limit(1))
+    return result.scalar()
+
+@instrument_crud
+async def get_translations_by_digests(session: AsyncSession, text_digests: List[str]):
+    """
+    Retrieves past translations for several translation memory keys in one query.
+
+    Args:
+        session (AsyncSession): The database session.
+        text_digests (List[str]): The translation memory keys.
+
+    Returns:
+        Dict[str, Tuple[str, str]]: The translated text and source language for each key found.
+    """
+    result = await session.execute(
+        select(TranslationTask.text_digest, TranslationTask.translated_text, TranslationTask.source_language)
+        .where(TranslationTask.text_digest.in_(text_digests))
+        # One row per key, however often a popular text was translated
+        .distinct(TranslationTask.text_digest)
+    )
+    return {digest: (translated_text, source) for (digest, translated_text, source) in result}
+
+
+@instrument_crud
+async def has_trigram_index(session: AsyncSession):
+    """
+    Tells whether the trigram index used for fuzzy translation memory lookups exists (see migrations 0005 and 0009).
+
+    Args:
+        session (AsyncSession): The database session.
+
+    Returns:
+        bool: True if fuzzy lookups can be made.
+    """
+    result = await session.execute(select(func.to_regclass("ix_translation_tasks_text_trgm").isnot(None)))
+    return result.scalar()
+
+@instrument_crud
+async def get_similar_translation(session: AsyncSession, user_id: int, source: Optional[str], target: str, text: str):
+    """
+    Retrieves the user's past translation whose text is the most similar to the given one, by trigram similarity.
+
+    Only the user's own tasks are searched, so no other user's texts or translations are ever disclosed.
+    The `%` operator keeps the index scan to texts at least as similar as pg_trgm.similarity_threshold
+    (0.3 by default).
+
+    Args:
+        session (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+        source (Optional[str]): The requested source language, None to match any.
+        target (str): The target language.
+        text (str): The text to translate.
+
+    Returns:
+        Optional[Row]: The translated text, source language and similarity (0 to 1) of the closest match, or None.
+    """
+    query = (
+        select(TranslationTask.translated_text, TranslationTask.source_language,
+               func.similarity(TranslationTask.text_to_translate, text).label("score"))
+        .where(TranslationTask.user_id == user_id)
+        .where(TranslationTask.status == TaskStatus.DONE)
+        .where(TranslationTask.text_digest.isnot(None))
+        .where(TranslationTask.target_language == target)
+        .where(TranslationTask.text_to_translate.op("%")(text))
+        .order_by(TranslationTask.text_to_translate.op("<->")(text))
+        .limit(1)
+    )
+    if source:
+        query = query.where(TranslationTask.source_language == source)
+
+    result = await session.execute(query)
+    return result.first()
+
+
+@instrument_crud
+async def claim_pending_tasks(session: AsyncSession, limit: int, lease_seconds: float):
+    """
+    Claims queued translation tasks for a worker.
+
+    Pending tasks, and running tasks whose lease has expired (their worker died), are marked as running.
+    Rows locked by other workers are skipped, so several workers can drain the queue concurrently.
+
+    Users are served in turn: only the oldest queued task of each user is a candidate, and the user whose
+    tasks were claimed least recently goes first, so one user queueing many tasks doesn't delay the others.
+
+    Args:
+        session (AsyncSession): The database session.
+        limit (int): The maximum number of tasks to claim.
+        lease_seconds (float): How long a claim is valid before another worker may retry the task.
+
+    Returns:
+        List[Row]: The id, source_language, target_language, text_to_translate and attempts (this claim included)
+        of each claimed task.
+    """
+    queued = aliased(TranslationTask)
+    heads = (
+        select(queued.id)
+        .where(or_(
+            queued.status == TaskStatus.PENDING,
+            and_(queued.status == TaskStatus.RUNNING,
+                 queued.claimed_at < func.now() - timedelta(seconds=lease_seconds)),
+        ))
+        .distinct(queued.user_id)
+        .order_by(queued.user_id, queued.id)
+    )
+
+    candidate = aliased(TranslationTask)
+    served = aliased(TranslationTask)
+    last_served = (
+        select(func.max(served.claimed_at))
+        .where(served.user_id == candidate.user_id)
+        .correlate(candidate)
+        .scalar_subquery()
+    )
+    claimable = (
+        select(candidate.id)
+        .where(candidate.id.in_(heads))
+        .order_by(last_served.asc().nullsfirst(), candidate.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+
+    result = await session.execute(
+        update(TranslationTask)
+        .where(TranslationTask.id.in_(claimable))
+        .values(status=TaskStatus.RUNNING, claimed_at=func.now(), attempts=TranslationTask.attempts + 1)
+        .returning(TranslationTask.id, TranslationTask.source_language,
+                   TranslationTask.target_language, TranslationTask.text_to_translate, TranslationTask.attempts)
+        .execution_options(synchronize_session=False)
+    )
+    tasks = result.all()
+    await session.commit()
+    return tasks
+
+@instrument_crud
+async def complete_translation_task(session: AsyncSession, task_id: int, source: str, translated_text: str, text_digest: str):
+    """
+    Stores the result of a queued translation task and marks it as done.
+
+    Args:
+        session (AsyncSession): The database session.
+        task_id (int): The ID of the translation task.
+        source (str): The source language of the text.
+        translated_text (str): The translated text.
+        text_digest (str): The translation memory key of the task.
+
+    Returns:
+        None
+    """
+    await session.execute(
+        update(TranslationTask)
+        .where(TranslationTask.id == task_id)
+        .values(status=TaskStatus.DONE, source_language=source, translated_text=translated_text, text_digest=text_digest)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+@instrument_crud
+async def retry_translation_task(session: AsyncSession, task_id: int, delay: float, lease_seconds: float):
+    """
+    Hands a claimed translation task back to the queue, to be claimed again once `delay` seconds have passed.
+
+    The task stays running with its lease moved so that it expires after `delay`, the way tasks of dead workers
+    are retried.
+
+    Args:
+        session (AsyncSession): The database session.
+        task_id (int): The ID of the translation task.
+        delay (float): Seconds before the task may be claimed again.
+        lease_seconds (float): The lease used by claim_pending_tasks.
+
+    Returns:
+        None
+    """
+    await session.execute(
+        update(TranslationTask)
+        .where(TranslationTask.id == task_id)
+        .values(claimed_at=func.now() - timedelta(seconds=lease_seconds) + timedelta(seconds=delay))
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+@instrument_crud
+async def fail_translation_task(session: AsyncSession, task_id: int):
+    """
+    Marks a queued translation task as failed.
+
+    Args:
+        session (AsyncSession): The database session.
+        task_id (int): The ID of the translation task.
+
+    Returns:
+        None
+    """
+    await session.execute(
+        update(TranslationTask)
+        .where(TranslationTask.id == task_id)
+        .values(status=TaskStatus.FAILED)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
     
     
-async def create_translation_rating(rating: RatingIn, task_id: int):
+# Counters of rating_stats, see _rating_stats_update
+RATING_STATS_COUNTERS = ("rating_count", "rating_sum", "rating_1", "rating_2", "rating_3", "rating_4", "rating_5")
+
+def _rating_stats_update(pair, rating: int, delta: int):
+    """
+    Builds the upsert adding (delta=1) or removing (delta=-1) a rating to the stats of a language pair.
+
+    Args:
+        pair (Select): A select of the (source_language, target_language) pair, producing at most one row.
+        rating (int): The rating value.
+        delta (int): 1 when a rating is created, -1 when it is removed.
+    """
+    counters = [literal(delta), literal(delta * rating)] + [literal(delta if value == rating else 0) for value in range(1, 6)]
+    statement = pg_insert(RatingStats).from_select(
+        ["source_language", "target_language", *RATING_STATS_COUNTERS], pair.add_columns(*counters))
+    return statement.on_conflict_do_update(
+        index_elements=[RatingStats.source_language, RatingStats.target_language],
+        set_={counter: getattr(RatingStats, counter) + statement.excluded[counter] for counter in RATING_STATS_COUNTERS},
+    )
+
+@instrument_crud
+async def create_translation_rating(session: AsyncSession, rating: RatingIn, task_id: int, user_id: int):
     """
-    Creates a rating for a translation task.
+    Creates a rating for a translation task, in a single statement, and adds it to the rating stats.
+
+    The rating is only inserted if the task exists, is owned by the user, is done and has not been rated yet.
+    The unique constraint on ratings.translation_id makes the last check race-free.
 
     Args:
+        session (AsyncSession): The database session.
         rating (RatingIn): The input data for the rating.
         task_id (int): The ID of the translation task.
+        user_id (int): The ID of the user rating the task.
 
     Returns:
-        RatingOut: The created rating.
+        Optional[RatingOut]: The created rating, or None if the task can't be rated.
     """
-    async with AsyncSession(async_engine) as session:
-        new_rating = Rating(translation_id=task_id, rating=rating.rating, feedback=rating.feedback)
-
-        session.add(new_rating)
+    ratable_task = (
+        select(TranslationTask.id, literal(rating.rating), literal(rating.feedback))
+        .where(TranslationTask.id == task_id)
+        .where(TranslationTask.user_id == user_id)
+        .where(TranslationTask.status == TaskStatus.DONE)
+    )
+    result = await session.execute(
+        pg_insert(Rating)
+        .from_select(["translation_id", "rating", "feedback"], ratable_task)
+        .on_conflict_do_nothing(index_elements=[Rating.translation_id])
+        .returning(Rating.id, Rating.rating, Rating.feedback)
+    )
+    new_rating = result.first()
+    if new_rating is None:
         await session.commit()
-        await session.refresh(new_rating)
+        return None
 
-        return RatingOut(
-            id=new_rating.id,
-            rating=new_rating.rating,
-            feedback=new_rating.feedback
-        )
-    
-async def get_rating_by_task_id(translation_id: int):
+    # Same transaction, so the stats never miss or double count a rating
+    await session.execute(_rating_stats_update(
+        select(TranslationTask.source_language, TranslationTask.target_language)
+        .where(TranslationTask.id == task_id)
+        .where(TranslationTask.source_language.isnot(None)),
+        new_rating.rating, 1))
+    await session.commit()
+
+    return RatingOut(
+        id=new_rating.id,
+        rating=new_rating.rating,
+        feedback=new_rating.feedback
+    )
+
+@instrument_crud
+async def get_task_with_rating(session: AsyncSession, task_id: int, user_id: int):
+    """
+    Retrieves a translation task owned by a user together with its rating, in one query.
+
+    Args:
+        session (AsyncSession): The database session.
+        task_id (int): The ID of the translation task.
+        user_id (int): The ID of the user owning the task.
+
+    Returns:
+        Optional[Row]: The TranslationTask and its Rating (None if not rated), or None if the user has no such task.
+    """
+    result = await session.execute(
+        select(TranslationTask, Rating)
+        .outerjoin(Rating, Rating.translation_id == TranslationTask.id)
+        .where(TranslationTask.id == task_id)
+        .where(TranslationTask.user_id == user_id)
+    )
+    return result.first()
+
+@instrument_crud
+async def get_rating_by_task_id(session: AsyncSession, translation_id: int):
     """
     Retrieves a rating associated with a translation task.
 
     Args:
+        session (AsyncSession): The database session.
         translation_id (int): The ID of the translation task.
 
     Returns:
         Optional[Rating]: The rating associated with the translation task, or None if not found.
     """
-    async with AsyncSession(async_engine) as session:
-        result = await session.execute(select(Rating).filter_by(translation_id=translation_id))
-        return result.scalar()
+    result = await session.execute(select(Rating).filter_by(translation_id=translation_id))
+    return result.scalar()
 
-async def remove_rating(id: int):
+@instrument_crud
+async def remove_rating(session: AsyncSession, task_id: int, user_id: int):
     """
-    Deletes a rating with the given ID.
+    Deletes the rating of a translation task owned by a user, in a single statement, and removes it from the rating stats.
 
     Args:
-        id (int): The ID of the rating to delete.
+        session (AsyncSession): The database session.
+        task_id (int): The ID of the rated translation task.
+        user_id (int): The ID of the user owning the task.
 
     Returns:
-        None
+        Optional[int]: The ID of the deleted rating, or None if there was no such rating.
+    """
+    result = await session.execute(
+        delete(Rating)
+        .where(Rating.translation_id == task_id)
+        .where(Rating.translation_id == TranslationTask.id)
+        .where(TranslationTask.user_id == user_id)
+        .returning(Rating.id, Rating.rating, TranslationTask.source_language, TranslationTask.target_language)
+        .execution_options(synchronize_session=False)
+    )
+    deleted = result.first()
+    if deleted is not None and deleted.source_language is not None:
+        await session.execute(_rating_stats_update(
+            select(literal(deleted.source_language), literal(deleted.target_language)), deleted.rating, -1))
+    await session.commit()
+    return deleted.id if deleted is not None else None
+
+@instrument_crud
+async def get_rating_stats(session: AsyncSession, source: Optional[str] = None, target: Optional[str] = None):
     """
-    async with AsyncSession(async_engine) as session:
-        result = await session.execute(select(Rating).filter_by(id=id))
-        rating_to_delete = result.scalar()
+    Retrieves the rating stats of every language pair, or of the pairs matching the given languages.
 
-        await session.delete(rating_to_delete)
-        await session.commit()
+    Args:
+        session (AsyncSession): The database session.
+        source (Optional[str]): Only pairs translating from this language.
+        target (Optional[str]): Only pairs translating to this language.
 
+    Returns:
+        List[RatingStats]: The stats of each language pair, ordered by pair.
+    """
+    query = select(RatingStats).order_by(RatingStats.source_language, RatingStats.target_language)
+    if source:
+        query = query.where(RatingStats.source_language == source)
+    if target:
+        query = query.where(RatingStats.target_language == target)
+
+    result = await session.execute(query)
+    return result.scalars().all()
@@ -1,6 +1,9 @@
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy import MetaData, create_engine
 from databases import Database
+from app.metrics import timed
+from contextlib import AsyncExitStack
 import os
 
 
@@ -10,20 +13,70 @@ USERNAME = os.environ.get("POSTGRES_USER")
 PASSWORD = os.environ.get("POSTGRES_PASSWORD")
 DB_NAME = os.environ.get("POSTGRES_DB")
 
-# These have to be changed when running init_db.py
-HOST = "db"
-PORT = "5432"
+# Override these when running init_db.py outside of docker-compose
+HOST = os.environ.get("POSTGRES_HOST", "db")
+PORT = os.environ.get("POSTGRES_PORT", "5432")
 
-DATABASE_URL = f"postgresql+asyncpg://{USERNAME}:{PASSWORD}@{HOST}:{PORT}/{DB_NAME}"
+DATABASE_URL = os.environ.get("DATABASE_URL", f"postgresql+asyncpg://{USERNAME}:{PASSWORD}@{HOST}:{PORT}/{DB_NAME}")
+
+# Connection pool settings, per worker process
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+# Logging every statement is useful when debugging but slows every query down
+DB_ECHO = os.environ.get("DB_ECHO", "false").lower() in ("1", "true", "yes")
 
 metadata = MetaData()
 
 # Asynchronous engine for the main application
-async_engine = create_async_engine(DATABASE_URL, echo=True)
+async_engine = create_async_engine(
+    DATABASE_URL,
+    echo=DB_ECHO,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+)
+
+# Objects stay usable after commit, so handlers can return what they just stored without a refresh query
+async_session = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
 # Synchronous engine for administrative tasks
-sync_engine = create_engine(DATABASE_URL.replace("+asyncpg", ""), echo=True)
+sync_engine = create_engine(DATABASE_URL.replace("+asyncpg", ""), echo=DB_ECHO)
 
 
 # Useful connection for asynch raw SQL queries (might be useful later)
-database = Database(DATABASE_URL)
\ No newline at end of file
+database = Database(DATABASE_URL)
+
+
+async def get_session():
+    """
+    Provides one database session per request, shared by every crud call made while handling it.
+
+    We are using sqlalchemy's AsyncSession instead of databases' raw SQL constructs to leverage the benefits of ORM.
+    """
+    async with async_session() as session:
+        yield session
+
+
+async def warm_up_pool(connections: int = DB_POOL_SIZE):
+    """
+    Opens pool connections ahead of traffic, so the first requests of a worker don't pay for connecting.
+
+    Args:
+        connections (int): The number of connections to open.
+    """
+    # Connections are held until all are open, then returned to the pool, even if one fails to open
+    async with AsyncExitStack() as stack:
+        for _ in range(connections):
+            await stack.enter_async_context(async_engine.connect())
+
+
+async def release_connection(session: AsyncSession):
+    """
+    Ends the session's transaction so its pooled connection is returned while we wait on something slow,
+    such as a translation provider. The session opens a new transaction on its next query.
+    """
+    with timed("db"):
+        await session.commit()
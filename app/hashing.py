@@ -0,0 +1,104 @@
+from app.metrics import Histogram
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import bcrypt
+import os
+import time
+
+# bcrypt releases the GIL, so a thread pool runs hashes in parallel without blocking the event loop
+HASH_POOL_SIZE = int(os.environ.get("HASH_POOL_SIZE", os.cpu_count() or 2))
+# Hashes allowed to wait for a thread before new ones are rejected
+HASH_QUEUE_LIMIT = int(os.environ.get("HASH_QUEUE_LIMIT", 64))
+# bcrypt work factor for new passwords. Each increment doubles the cost of a hash.
+HASH_ROUNDS = int(os.environ.get("HASH_ROUNDS", 12))
+
+_LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+
+
+class HashingPoolFull(Exception):
+    """Raised when too many password hashes are already running or queued."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated, bounded thread pool.
+
+    At most `pool_size + queue_limit` operations are admitted at once, the rest are rejected
+    with HashingPoolFull so callers can shed load instead of queueing without bound.
+    """
+
+    def __init__(self, pool_size: int = HASH_POOL_SIZE, queue_limit: int = HASH_QUEUE_LIMIT, rounds: int = HASH_ROUNDS):
+        self.pool_size = pool_size
+        self.queue_limit = queue_limit
+        self.rounds = rounds
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="bcrypt")
+        self.in_flight = 0
+        self.rejected = 0
+        # Time spent hashing, and time spent waiting for a free thread
+        self.duration = {"hash": Histogram(_LATENCY_BUCKETS), "check": Histogram(_LATENCY_BUCKETS)}
+        self.wait = Histogram(_LATENCY_BUCKETS)
+
+    async def hash(self, password: str) -> str:
+        """
+        Hashes a password with a fresh salt.
+
+        Raises:
+            HashingPoolFull: If the pool is saturated.
+        """
+        hashed = await self._run("hash", lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)))
+        return hashed.decode('utf-8')
+
+    async def check(self, password: str, hashed_password: str) -> bool:
+        """
+        Checks a password against its hash.
+
+        Raises:
+            HashingPoolFull: If the pool is saturated.
+        """
+        return await self._run("check", lambda: bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8')))
+
+    async def _run(self, operation: str, fn):
+        if self.in_flight >= self.pool_size + self.queue_limit:
+            self.rejected += 1
+            raise HashingPoolFull()
+
+        submitted = time.perf_counter()
+        started = None
+
+        def timed():
+            nonlocal started
+            started = time.perf_counter()
+            return fn()
+
+        def release():
+            self.in_flight -= 1
+            if started is not None:
+                self.wait.observe(started - submitted)
+                self.duration[operation].observe(time.perf_counter() - started)
+
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            future = self.executor.submit(timed)
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        # Released once the thread is done rather than when the caller stops waiting: a cancelled request
+        # doesn't stop a running hash, which keeps its thread busy
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(release))
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        return {
+            "pool_size": self.pool_size,
+            "queue_limit": self.queue_limit,
+            "rounds": self.rounds,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "wait_seconds": self.wait.snapshot(),
+            "hash_seconds": self.duration["hash"].snapshot(),
+            "check_seconds": self.duration["check"].snapshot(),
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,114 @@
+from app.cache import LRUCache
+from typing import FrozenSet, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Where the supported languages are saved, so a cold start doesn't need the provider
+LANGUAGES_SNAPSHOT_PATH = os.environ.get("LANGUAGES_SNAPSHOT_PATH")
+# Seconds between background refreshes of the supported languages
+LANGUAGES_REFRESH_INTERVAL = float(os.environ.get("LANGUAGES_REFRESH_INTERVAL", 24 * 3600))
+# Detected source languages remembered per text
+DETECTION_CACHE_SIZE = int(os.environ.get("DETECTION_CACHE_SIZE", 50000))
+
+
+class LanguageRegistry:
+    """
+    The languages supported by a translation provider, loaded on first use.
+
+    Languages are kept in a frozenset for constant-time membership checks and saved to a snapshot file.
+    Later starts read the snapshot instead of calling the provider, and a background task refreshes
+    the list from the provider periodically.
+    """
+
+    def __init__(self, provider, snapshot_path: Optional[str] = LANGUAGES_SNAPSHOT_PATH,
+                 refresh_interval: float = LANGUAGES_REFRESH_INTERVAL):
+        self.provider = provider
+        self.snapshot_path = snapshot_path or os.path.join(tempfile.gettempdir(), f"languages-{provider.name}.json")
+        self.refresh_interval = refresh_interval
+        self._languages: Optional[FrozenSet[str]] = None
+        self._loading: Optional[asyncio.Future] = None
+        self._task = None
+
+    async def load(self) -> FrozenSet[str]:
+        """
+        Returns the supported languages, reading the snapshot or calling the provider the first time.
+
+        The snapshot and the provider client may block, so they are read in a thread. Concurrent callers share a
+        single load, and a failed load is retried by the next caller.
+
+        Returns:
+            FrozenSet[str]: The ISO 639-1 codes of the supported languages.
+        """
+        if self._languages is None:
+            if self._loading is None:
+                self._loading = asyncio.get_running_loop().run_in_executor(
+                    None, lambda: self._read_snapshot() or self.refresh())
+            loading = self._loading
+            try:
+                # Shielded so a cancelled caller doesn't fail the load for the others
+                self._languages = await asyncio.shield(loading)
+            finally:
+                if self._loading is loading and loading.done():
+                    self._loading = None
+        return self._languages
+
+    def refresh(self) -> FrozenSet[str]:
+        """
+        Fetches the supported languages from the provider and saves a snapshot.
+
+        Returns:
+            FrozenSet[str]: The ISO 639-1 codes of the supported languages.
+        """
+        self._languages = frozenset(self.provider.get_languages())
+        self._write_snapshot()
+        return self._languages
+
+    def _read_snapshot(self) -> Optional[FrozenSet[str]]:
+        try:
+            with open(self.snapshot_path) as f:
+                return frozenset(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def _write_snapshot(self):
+        # Write then rename, so concurrent workers never read a partial file
+        try:
+            directory = os.path.dirname(self.snapshot_path) or "."
+            with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as f:
+                json.dump(sorted(self._languages), f)
+            os.replace(f.name, self.snapshot_path)
+        except OSError:
+            logger.warning("Could not save the supported languages to %s", self.snapshot_path, exc_info=True)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                # The provider client may block, keep it off the event loop
+                await loop.run_in_executor(None, self.refresh)
+            except Exception:
+                logger.exception("Failed to refresh the supported languages")
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Source languages detected by the provider, keyed by text hash
+detection_cache = LRUCache(maxsize=DETECTION_CACHE_SIZE)
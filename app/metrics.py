@@ -0,0 +1,216 @@
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Sequence, Tuple
+import functools
+import time
+
+# Latency buckets, in seconds, shared by the duration histograms
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """
+    A cumulative histogram with fixed upper bounds, in the style of Prometheus histograms.
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        # One extra slot for observations above the largest bound (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        """
+        Returns the cumulative bucket counts, total count and sum.
+
+        Returns:
+            dict: The histogram state, buckets keyed by their upper bound.
+        """
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+
+        return {"buckets": buckets, "count": self.count, "sum": self.sum}
+
+
+class LatencyWindow:
+    """
+    The most recent observations of a latency, to estimate its current quantiles.
+    """
+
+    def __init__(self, size: int = 200):
+        self.values = deque(maxlen=size)
+
+    def observe(self, value: float):
+        self.values.append(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Returns the q-quantile (0 <= q <= 1) of the window, or None when it is empty.
+        """
+        if not self.values:
+            return None
+        ordered = sorted(self.values)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Metric:
+    """
+    A metric family: one counter or histogram per combination of label values.
+    """
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str], factory: Callable):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._factory()
+        return child
+
+    def samples(self):
+        for values, child in self._children.items():
+            labels = dict(zip(self.labelnames, values))
+            if isinstance(child, Histogram):
+                cumulative = 0
+                for bound, count in zip(child.buckets + [float("inf")], child.counts):
+                    cumulative += count
+                    yield "_bucket", {**labels, "le": "+Inf" if bound == float("inf") else repr(float(bound))}, cumulative
+                yield "_sum", labels, child.sum
+                yield "_count", labels, child.count
+            else:
+                yield "", labels, child.value
+
+
+class CallbackMetric:
+    """
+    A counter or gauge read from elsewhere when the metrics are collected, e.g. a pool or a cache's own counters.
+
+    The callback returns a dict mapping label value tuples to values.
+    """
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str], callback: Callable[[], dict]):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def samples(self):
+        for values, value in self.callback().items():
+            yield "", dict(zip(self.labelnames, values)), value
+
+
+class Registry:
+    """
+    The process's metrics, rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self._add(Metric(name, help, "counter", labelnames, Counter))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DURATION_BUCKETS) -> Metric:
+        return self._add(Metric(name, help, "histogram", labelnames, lambda: Histogram(buckets)))
+
+    def callback(self, name: str, help: str, kind: str, labelnames: Sequence[str], callback: Callable[[], dict]) -> CallbackMetric:
+        return self._add(CallbackMetric(name, help, kind, labelnames, callback))
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                label_text = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+                lines.append(f"{metric.name}{suffix}{{{label_text}}} {value}" if label_text else f"{metric.name}{suffix} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+CRUD_SECONDS = registry.histogram("crud_duration_seconds", "Latency of database operations", ("function",))
+STAGE_SECONDS = registry.histogram("request_stage_duration_seconds", "Time spent in each stage of a request", ("stage",))
+
+# Seconds spent in each stage by the request being handled, reported in its Server-Timing header
+request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Measures a stage of the current request, e.g. "jwt" or "provider".
+
+    The time is added to the request's Server-Timing breakdown and to the stage histogram.
+    Stages entered several times in a request are summed.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def record_stage(stage: str, elapsed: float):
+    STAGE_SECONDS.labels(stage).observe(elapsed)
+    timings = request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def instrument_crud(function):
+    """
+    Decorates a crud coroutine so its latency is recorded per function and counted in the request's "db" stage.
+    """
+    histogram = CRUD_SECONDS.labels(function.__name__)
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            histogram.observe(elapsed)
+            record_stage("db", elapsed)
+
+    return wrapper
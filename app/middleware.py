@@ -1,21 +1,83 @@
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.requests import Request
 from starlette.responses import JSONResponse
-from app.crud import is_token_blacklisted
+from app.blacklist import token_blacklist
+from app.metrics import REQUEST_SECONDS, request_timings, timed
+from typing import Iterable
+import time
 
+# Routes that never look at the token, not worth checking
+BLACKLIST_SKIP_PATHS = ("/register", "/login", "/metrics", "/stats/", "/docs", "/redoc", "/openapi.json")
 
-class TokenBlacklistMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        token = request.headers.get("Authorization")
-        if token and token.startswith("Bearer "):
-            token = token.split(" ")[1]
-            if await is_token_blacklisted(token):
-                return JSONResponse(
-                    status_code=401, 
-                    content={"detail": "Token has been blacklisted"}
-                )
-                # Raising the exception here caused Uvicorn to propagate it as an Internal Server Error
-                # raise HTTPException(status_code=401, detail="Token has been blacklisted")
 
-        return await call_next(request)
+class TokenBlacklistMiddleware:
+    """
+    Rejects requests carrying a revoked token before they reach the routes.
 
+    A plain ASGI middleware: the Authorization header is read from the scope and the request and
+    response pass through untouched, so streaming responses aren't buffered. Paths starting with
+    one of `skip_paths` aren't checked at all.
+    """
+
+    def __init__(self, app, skip_paths: Iterable[str] = BLACKLIST_SKIP_PATHS):
+        self.app = app
+        self.skip_paths = tuple(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_paths):
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                # Parsed like HTTPBearer does, so every token it accepts is checked: the scheme is case-insensitive
+                scheme, _, credentials = value.partition(b" ")
+                if scheme.lower() == b"bearer":
+                    # In-process check, see app/blacklist.py
+                    with timed("blacklist"):
+                        revoked = credentials.decode("latin-1") in token_blacklist
+                    if revoked:
+                        response = JSONResponse(status_code=401, content={"detail": "Token has been blacklisted"})
+                        await response(scope, receive, send)
+                        return
+                break
+
+        await self.app(scope, receive, send)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of every request per route, and adds a Server-Timing header with the time spent
+    in each stage (see `app.metrics.timed`), so slow requests can be profiled from the client.
+
+    A plain ASGI middleware, so it adds no task or buffering around the request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = {}
+        context = request_timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                stages = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items()]
+                stages.append(f"total;dur={(time.perf_counter() - started) * 1000:.2f}")
+                headers = list(message.get("headers", [])) + [(b"server-timing", ", ".join(stages).encode("latin-1"))]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(context)
+            # Label by route template, not by path, to keep the number of series bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(time.perf_counter() - started)
@@ -0,0 +1,81 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from typing import List, Tuple
+import importlib.util
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Migration files live in the top-level migrations/ directory, named <version>_<description>.py
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+
+def available_migrations(directory: str = MIGRATIONS_DIR) -> List[Tuple[str, str]]:
+    """
+    Lists the migration files, in the order they must be applied.
+
+    Returns:
+        List[Tuple[str, str]]: The version and path of each migration.
+    """
+    files = sorted(name for name in os.listdir(directory) if name.endswith(".py") and name[0].isdigit())
+    return [(name.split("_", 1)[0], os.path.join(directory, name)) for name in files]
+
+
+def applied_migrations(connection: Connection) -> set:
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version VARCHAR(32) PRIMARY KEY, applied_at TIMESTAMP NOT NULL DEFAULT now())"
+    ))
+    return {row.version for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def _load(path: str):
+    spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _record(connection: Connection, version: str):
+    connection.execute(text("INSERT INTO schema_migrations (version) VALUES (:version)"), {"version": version})
+
+
+def migrate(engine: Engine, directory: str = MIGRATIONS_DIR) -> List[str]:
+    """
+    Applies the migrations that have not been applied yet.
+
+    Each migration runs in its own transaction together with its bookkeeping row, so a failed
+    migration leaves no trace and can be fixed and re-run. Migrations that set `TRANSACTIONAL = False`
+    run in autocommit mode instead, which CREATE/DROP INDEX CONCURRENTLY requires: each statement is
+    committed on its own, so their statements must be safe to re-run after a failure.
+
+    Args:
+        engine (Engine): A synchronous engine for the database to migrate.
+        directory (str): The directory holding the migration files.
+
+    Returns:
+        List[str]: The versions that were applied.
+    """
+    with engine.begin() as connection:
+        done = applied_migrations(connection)
+
+    applied = []
+    for version, path in available_migrations(directory):
+        if version in done:
+            continue
+
+        migration = _load(path)
+        logger.info("Applying migration %s: %s", version, (migration.__doc__ or "").strip())
+        if getattr(migration, "TRANSACTIONAL", True):
+            with engine.begin() as connection:
+                migration.upgrade(connection)
+                _record(connection, version)
+        else:
+            with engine.connect() as connection:
+                connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+                migration.upgrade(connection)
+                _record(connection, version)
+        applied.append(version)
+
+    return applied
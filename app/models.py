@@ -1,7 +1,7 @@
 from pydantic import BaseModel, validator
-from sqlalchemy import Column, Integer, String, Sequence, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Sequence, ForeignKey, DateTime, Index, func
 from sqlalchemy.ext.declarative import declarative_base
-from typing import Optional
+from typing import Dict, Optional
 
 
 Base = declarative_base()
@@ -13,22 +13,57 @@ class User(Base):
     id = Column(Integer, Sequence('user_id_seq'), primary_key=True)
     username = Column(String(50), unique=True, index=True)
     hashed_password = Column(String)
-
+    # Tokens carry the version they were issued under, bumping it revokes them all (see migration 0006)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
+    token_version_changed_at = Column(DateTime)
+
+# Lifecycle of a translation task. Synchronous tasks are created as done.
+class TaskStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+# Schema changes go through versioned migrations in migrations/, keep these models in sync with them.
 class TranslationTask(Base):
     __tablename__ = 'translation_tasks'
+    __table_args__ = (
+        # Keyset pagination of a user's tasks
+        Index('ix_translation_tasks_user_id_id', 'user_id', 'id'),
+        # Translation memory lookups (equality only)
+        Index('ix_translation_tasks_text_digest', 'text_digest', postgresql_using='hash'),
+        # Tasks waiting for a worker
+        Index('ix_translation_tasks_queue', 'id', postgresql_where="status IN ('pending', 'running')"),
+        # When each user was last served by a worker, to claim queued tasks fairly
+        Index('ix_translation_tasks_user_id_claimed_at', 'user_id', 'claimed_at', postgresql_where="claimed_at IS NOT NULL"),
+        # Fuzzy translation memory lookups within a user's tasks (pg_trgm and btree_gist, only where they are available)
+        Index('ix_translation_tasks_text_trgm', 'user_id', 'text_to_translate', postgresql_using='gist',
+              postgresql_ops={'text_to_translate': 'gist_trgm_ops'},
+              postgresql_where="status = 'done' AND text_digest IS NOT NULL"),
+    )
 
     id = Column(Integer, Sequence('translation_task_id_seq'), primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
-    source_language = Column(String(5), nullable=False)
+    # Source and translation are unknown until a queued task is processed
+    source_language = Column(String(5))
     target_language = Column(String(5), nullable=False)
     text_to_translate = Column(String, nullable=False)
-    translated_text = Column(String, nullable=False)
+    translated_text = Column(String)
+    status = Column(String(10), nullable=False, default=TaskStatus.DONE, server_default=TaskStatus.DONE)
+    # When a worker picked up the task, used to retry tasks of crashed workers
+    claimed_at = Column(DateTime)
+    # Times a worker claimed the task, to give up on tasks that keep failing
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    # Translation memory key (see app/translation_memory.py)
+    text_digest = Column(String(64))
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
 
 class Rating(Base):
     __tablename__ = 'ratings'
 
     id = Column(Integer, Sequence('ratings_id_seq'), primary_key=True)
-    translation_id = Column(Integer, ForeignKey('translation_tasks.id'))
+    # A task has at most one rating
+    translation_id = Column(Integer, ForeignKey('translation_tasks.id'), unique=True)
     rating = Column(Integer, nullable=False)
     feedback = Column(String)
 
@@ -39,12 +74,31 @@ class Rating(Base):
         
         return rating
 
+# Ratings summed up per language pair, kept up to date as ratings are created and removed,
+# so quality dashboards don't scan the ratings table.
+class RatingStats(Base):
+    __tablename__ = 'rating_stats'
+
+    source_language = Column(String(5), primary_key=True)
+    target_language = Column(String(5), primary_key=True)
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(BigInteger, nullable=False, default=0)
+    # Histogram: the number of ratings of each value
+    rating_1 = Column(Integer, nullable=False, default=0)
+    rating_2 = Column(Integer, nullable=False, default=0)
+    rating_3 = Column(Integer, nullable=False, default=0)
+    rating_4 = Column(Integer, nullable=False, default=0)
+    rating_5 = Column(Integer, nullable=False, default=0)
+
 # Used to implement the logout function.
 class BlacklistedToken(Base):
     __tablename__ = 'blacklisted_tokens'
 
     id = Column(Integer, Sequence('blacklisted_token_id_seq'), primary_key=True)
-    token = Column(String, unique=True, index=True, nullable=False)
+    # SHA-256 of the token, so entries stay fixed-size whatever the token carries
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    # Expiration of the token. Expired tokens are rejected anyway, so their entries are purged.
+    expires_at = Column(DateTime, index=True)
 
 
 
@@ -61,6 +115,10 @@ class UserIn(BaseModel):
 class UserOut(BaseModel):
     username: str
 
+class PasswordChangeIn(BaseModel):
+    old_password: str
+    new_password: str
+
 class TranslationTaskIn(BaseModel):
     source_language: Optional[str] = None
     target_language: str
@@ -68,11 +126,23 @@ class TranslationTaskIn(BaseModel):
 
 class TranslationTaskOut(TranslationTaskIn):
     id: int
-    translated_text: str
+    translated_text: Optional[str] = None
+    status: str = TaskStatus.DONE
+    # Translation memory match: 1 when a past translation of the same text was reused. Below 1, the past
+    # translation of a similar text, only suggested next to the fresh translation. None when there is no match.
+    match_score: Optional[float] = None
+    suggested_translation: Optional[str] = None
 
 class RatingIn(BaseModel):
     rating: int
     feedback: Optional[str] = None
 
 class RatingOut(RatingIn):
-    id: int
\ No newline at end of file
+    id: int
+
+class QualityStatsOut(BaseModel):
+    source_language: str
+    target_language: str
+    count: int
+    average: Optional[float] = None
+    histogram: Dict[str, int]
\ No newline at end of file
@@ -0,0 +1,355 @@
+from app.metrics import registry
+from app.ratelimit import RateLimiter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import asyncio
+import os
+import random
+import time
+
+# Provider selection and limits
+TRANSLATION_PROVIDER = os.environ.get("TRANSLATION_PROVIDER", "google")
+PROVIDER_MAX_CONCURRENCY = int(os.environ.get("PROVIDER_MAX_CONCURRENCY", 16))
+PROVIDER_TIMEOUT = float(os.environ.get("PROVIDER_TIMEOUT", 10))
+# Characters sent in a single provider call. Longer texts go alone, callers split them (see app/chunking.py).
+PROVIDER_MAX_BATCH_CHARS = int(os.environ.get("PROVIDER_MAX_BATCH_CHARS", 30000))
+# Retries of calls failing with a retryable error (quota or transient server errors), with jittered exponential backoff
+PROVIDER_MAX_RETRIES = int(os.environ.get("PROVIDER_MAX_RETRIES", 3))
+PROVIDER_RETRY_BASE_DELAY = float(os.environ.get("PROVIDER_RETRY_BASE_DELAY", 0.2))
+PROVIDER_RETRY_MAX_DELAY = float(os.environ.get("PROVIDER_RETRY_MAX_DELAY", 5))
+MOCK_PROVIDER_LATENCY_MS = float(os.environ.get("MOCK_PROVIDER_LATENCY_MS", 0))
+# Base URL of an HTTP translation service (see bench/provider_server.py for a local stand-in)
+HTTP_PROVIDER_URL = os.environ.get("HTTP_PROVIDER_URL", "http://localhost:8001")
+
+
+class ProviderError(Exception):
+    """Raised when a translation provider call fails. Retryable errors may succeed if the call is sent again."""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class ProviderTimeout(ProviderError):
+    """Raised when a translation provider call does not finish in time."""
+
+
+class ProviderRateLimited(ProviderError):
+    """Raised when a call is over the provider quota, ours or the provider's own."""
+
+    def __init__(self, message: str, retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message, retryable)
+        self.retry_after = retry_after
+
+
+class ProviderRejected(ProviderError):
+    """Raised when the provider refuses a call as invalid (a 4xx answer), so sending it again or elsewhere won't help."""
+
+
+PROVIDER_SECONDS = registry.histogram("provider_call_duration_seconds", "Latency of translation provider calls",
+                                      ("provider", "outcome"))
+PROVIDER_CHARACTERS = registry.counter("provider_characters_total", "Characters sent to translation providers", ("provider",))
+
+# HTTP statuses worth retrying: quota and transient server errors
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TranslationProvider:
+    """
+    Base class for translation providers.
+
+    Providers expose an async `translate` so handlers never block the event loop, and bound
+    the number of in-flight calls with a semaphore. Calls are throttled to the provider's rate limits
+    and retried with backoff when they fail with a retryable error.
+    """
+
+    name = "base"
+    # Maximum number of segments, and of characters, sent in a single provider call
+    max_batch_size = 128
+    max_batch_chars = PROVIDER_MAX_BATCH_CHARS
+
+    def __init__(self, max_concurrency: int = PROVIDER_MAX_CONCURRENCY, timeout: float = PROVIDER_TIMEOUT,
+                 max_retries: int = PROVIDER_MAX_RETRIES):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = RateLimiter.for_provider(self.name)
+        self.retries = 0
+        self._semaphore = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def get_languages(self) -> List[str]:
+        """
+        Returns the ISO 639-1 codes of the languages supported by the provider.
+        """
+        raise NotImplementedError
+
+    async def quota_wait(self, chars: int) -> float:
+        """
+        Returns how long a call of `chars` characters would currently wait for this provider's rate limits.
+        """
+        return await self.limiter.wait_time(chars)
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.name,
+            "max_concurrency": self.max_concurrency,
+            "timeout": self.timeout,
+            "retries": self.retries,
+            "rate_limit": self.limiter.stats(),
+        }
+
+    async def translate(self, text: str, source: Optional[str], target: str) -> Tuple[str, str]:
+        """
+        Translates a single text. See `translate_batch`.
+
+        Returns:
+            Tuple[str, str]: The translated text and the (possibly detected) source language.
+        """
+        return (await self.translate_batch([text], source, target))[0]
+
+    async def translate_batch(self, texts: List[str], source: Optional[str], target: str) -> List[Tuple[str, str]]:
+        """
+        Translates several texts sharing a language pair, respecting the provider's concurrency limit and timeout.
+
+        Texts are sent as multi-segment calls of at most `max_batch_size` segments and `max_batch_chars`
+        characters each.
+        Cancelling the awaiting task cancels the provider calls.
+
+        Args:
+            texts (List[str]): The texts to translate.
+            source (Optional[str]): The source language, None to have the provider detect it.
+            target (str): The target language.
+
+        Returns:
+            List[Tuple[str, str]]: The translated text and the (possibly detected) source language of each text, in order.
+
+        Raises:
+            ProviderTimeout: If a call takes longer than the provider's timeout.
+            ProviderRateLimited: If a call would wait longer than the provider's timeout for quota, or the provider kept refusing it.
+            ProviderError: If a provider call fails.
+        """
+        segments = []
+        segment, chars = [], 0
+        for text in texts:
+            if segment and (len(segment) >= self.max_batch_size or chars + len(text) > self.max_batch_chars):
+                segments.append(segment)
+                segment, chars = [], 0
+            segment.append(text)
+            chars += len(text)
+        if segment:
+            segments.append(segment)
+
+        results = await asyncio.gather(*(self._call(segment, source, target) for segment in segments))
+        return [translation for result in results for translation in result]
+
+    async def _call(self, texts: List[str], source: Optional[str], target: str) -> List[Tuple[str, str]]:
+        attempt = 0
+        while True:
+            try:
+                return await self._call_once(texts, source, target)
+            except ProviderError as e:
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                # Full jitter, so clients throttled together don't retry together
+                delay = random.uniform(0, min(PROVIDER_RETRY_MAX_DELAY, PROVIDER_RETRY_BASE_DELAY * 2 ** attempt))
+                if isinstance(e, ProviderRateLimited) and e.retry_after:
+                    delay = max(delay, e.retry_after)
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+    async def _call_once(self, texts: List[str], source: Optional[str], target: str) -> List[Tuple[str, str]]:
+        # Wait for quota before taking a concurrency slot
+        wait = await self.limiter.acquire(sum(len(text) for text in texts), max_wait=self.timeout)
+        if wait:
+            raise ProviderRateLimited(f"{self.name} rate limit reached", retry_after=wait)
+
+        async with self.semaphore:
+            PROVIDER_CHARACTERS.labels(self.name).inc(sum(len(text) for text in texts))
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await asyncio.wait_for(self._translate_batch(texts, source, target), timeout=self.timeout)
+                outcome = "ok"
+                return result
+            except asyncio.TimeoutError as e:
+                outcome = "timeout"
+                raise ProviderTimeout(f"{self.name} did not answer within {self.timeout}s") from e
+            except ProviderError:
+                raise
+            except Exception as e:
+                raise self._map_error(e) from e
+            finally:
+                PROVIDER_SECONDS.labels(self.name, outcome).observe(time.perf_counter() - started)
+
+    def _map_error(self, error: Exception) -> ProviderError:
+        """
+        Turns an error raised by the provider client into a ProviderError, telling whether it is worth retrying.
+        """
+        return ProviderError(f"{self.name} translation failed: {error}")
+
+    async def _translate_batch(self, texts: List[str], source: Optional[str], target: str) -> List[Tuple[str, str]]:
+        raise NotImplementedError
+
+
+class GoogleProvider(TranslationProvider):
+    """
+    Google Cloud Translation (v2). The client is synchronous, so calls run on a bounded thread pool.
+    """
+
+    name = "google"
+
+    def __init__(self, max_concurrency: int = PROVIDER_MAX_CONCURRENCY, timeout: float = PROVIDER_TIMEOUT):
+        super().__init__(max_concurrency, timeout)
+        # Imported here so other providers work without Google credentials
+        from google.cloud import translate_v2 as translate
+
+        self.client = translate.Client()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="google-translate")
+
+    def get_languages(self) -> List[str]:
+        return [item['language'] for item in self.client.get_languages()]
+
+    async def _translate_batch(self, texts: List[str], source: Optional[str], target: str) -> List[Tuple[str, str]]:
+        loop = asyncio.get_running_loop()
+
+        # The v2 client accepts a list of strings and returns one result per string.
+        # Without a source language the Translation API will try to detect it.
+        results = await loop.run_in_executor(
+            self.executor, lambda: self.client.translate(texts, source_language=source, target_language=target))
+        return [(result["translatedText"], source or result["detectedSourceLanguage"]) for result in results]
+
+    def _map_error(self, error: Exception) -> ProviderError:
+        # google.api_core exceptions carry the HTTP status in `code`
+        status = getattr(error, "code", None)
+        if status == 429:
+            return ProviderRateLimited(f"{self.name} quota exceeded: {error}", retryable=True)
+        if isinstance(status, int) and 400 <= status < 500:
+            return ProviderRejected(f"{self.name} rejected the call: {error}")
+        retryable = status in RETRYABLE_STATUSES or isinstance(error, ConnectionError)
+        return ProviderError(f"{self.name} translation failed: {error}", retryable=retryable)
+
+
+def mock_translate(text: str, target_language: str) -> str:
+    return f"{text} [Translated to {target_language}]"
+
+
+class MockProvider(TranslationProvider):
+    """
+    Local stub provider used to save on API costs and to measure throughput without the network.
+
+    `MOCK_PROVIDER_LATENCY_MS` injects a fixed delay per call.
+    """
+
+    name = "mock"
+
+    # Small fixed set so language validation still behaves like the real provider
+    languages = ["de", "en", "es", "fr", "it", "ja", "nl", "pt", "ru", "zh"]
+
+    def __init__(self, max_concurrency: int = PROVIDER_MAX_CONCURRENCY, timeout: float = PROVIDER_TIMEOUT,
+                 latency_ms: float = MOCK_PROVIDER_LATENCY_MS):
+        super().__init__(max_concurrency, timeout)
+        self.latency_ms = latency_ms
+
+    def get_languages(self) -> List[str]:
+        return list(self.languages)
+
+    async def _translate_batch(self, texts: List[str], source: Optional[str], target: str) -> List[Tuple[str, str]]:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return [(mock_translate(text, target), source or "en") for text in texts]
+
+
+class HttpProvider(TranslationProvider):
+    """
+    A translation service reached over HTTP, speaking a Google v2-like JSON protocol:
+
+    - `GET /languages` returns a list of language codes.
+    - `POST /translate` takes `{"texts": [...], "source": ..., "target": ...}` and returns
+      `{"translations": [{"translatedText": ..., "detectedSourceLanguage": ...}, ...]}`.
+    """
+
+    name = "http"
+
+    def __init__(self, max_concurrency: int = PROVIDER_MAX_CONCURRENCY, timeout: float = PROVIDER_TIMEOUT,
+                 base_url: str = HTTP_PROVIDER_URL):
+        super().__init__(max_concurrency, timeout)
+        self.base_url = base_url.rstrip("/")
+        self._client = None
+
+    @property
+    def client(self):
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency))
+        return self._client
+
+    def get_languages(self) -> List[str]:
+        import httpx
+
+        response = httpx.get(f"{self.base_url}/languages", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    async def _translate_batch(self, texts: List[str], source: Optional[str], target: str) -> List[Tuple[str, str]]:
+        response = await self.client.post("/translate", json={"texts": texts, "source": source, "target": target})
+        response.raise_for_status()
+        return [(result["translatedText"], source or result["detectedSourceLanguage"])
+                for result in response.json()["translations"]]
+
+    def _map_error(self, error: Exception) -> ProviderError:
+        import httpx
+
+        if isinstance(error, httpx.HTTPStatusError):
+            status = error.response.status_code
+            if status == 429:
+                retry_after = error.response.headers.get("Retry-After")
+                return ProviderRateLimited(f"{self.name} quota exceeded", retryable=True,
+                                           retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+            if 400 <= status < 500:
+                return ProviderRejected(f"{self.name} answered {status}")
+            return ProviderError(f"{self.name} answered {status}", retryable=status in RETRYABLE_STATUSES)
+        return ProviderError(f"{self.name} translation failed: {error}", retryable=isinstance(error, httpx.TransportError))
+
+
+PROVIDERS = {
+    GoogleProvider.name: GoogleProvider,
+    MockProvider.name: MockProvider,
+    HttpProvider.name: HttpProvider,
+}
+
+
+def get_provider(name: str = TRANSLATION_PROVIDER) -> TranslationProvider:
+    """
+    Instantiates the configured translation provider.
+
+    A comma-separated list of names gives a `ProviderRouter` over those providers, in order of preference.
+
+    Args:
+        name (str): The provider name, one of `PROVIDERS`, or a comma-separated list of them.
+
+    Returns:
+        TranslationProvider: The provider instance.
+    """
+    names = [n.strip() for n in name.split(",") if n.strip()]
+    for n in names:
+        if n not in PROVIDERS:
+            raise ValueError(f"Unknown translation provider '{n}'. Choose one of: {', '.join(PROVIDERS)}")
+
+    if len(names) == 1:
+        return PROVIDERS[names[0]]()
+
+    from app.routing import ProviderRouter
+
+    return ProviderRouter([PROVIDERS[n]() for n in names])
@@ -0,0 +1,354 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Where token buckets are kept so every worker process on the host shares the provider quota.
+# Set to "memory" to keep them per process.
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", os.path.join(tempfile.gettempdir(), "translator-ratelimit.sqlite3"))
+# Seconds of traffic a bucket may accumulate, so short bursts go through at full speed
+RATE_LIMIT_BURST_SECONDS = float(os.environ.get("RATE_LIMIT_BURST_SECONDS", 1))
+
+# Requests calling the provider at the same time, per worker. Others wait in per-user queues.
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 64))
+# Requests a single user may have waiting before getting 429s
+ADMISSION_MAX_QUEUED_PER_USER = int(os.environ.get("ADMISSION_MAX_QUEUED_PER_USER", 16))
+# Longest a request may wait, for a slot or for provider quota, before getting a 429
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", 2))
+
+# (key, amount, rate per second, capacity) of a bucket to take tokens from
+BucketRequest = Tuple[str, float, float, float]
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, capacity: float) -> float:
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+class MemoryBucketStore:
+    """
+    Token buckets kept in process.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def take(self, requests: List[BucketRequest], consume: bool = True) -> float:
+        """
+        Takes tokens from several buckets at once, either from all of them or from none.
+
+        Args:
+            requests (List[BucketRequest]): The buckets and the amounts to take.
+            consume (bool): If false, only reports how long the call would have to wait.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the seconds until they are all available.
+        """
+        now = time.time()
+        levels = []
+        wait = 0.0
+        for key, amount, rate, capacity in requests:
+            (tokens, updated) = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated, now, rate, capacity)
+            levels.append((key, tokens - amount))
+            wait = max(wait, (amount - tokens) / rate)
+
+        if wait <= 0 and consume:
+            for key, tokens in levels:
+                self._buckets[key] = (tokens, now)
+        return max(wait, 0.0)
+
+    async def take_async(self, requests: List[BucketRequest], consume: bool = True) -> float:
+        """Same as `take`, for callers on the event loop."""
+        return self.take(requests, consume)
+
+
+class SqliteBucketStore:
+    """
+    Token buckets kept in a local SQLite database, shared by every process on the host.
+
+    Each take is one short IMMEDIATE transaction, which SQLite serializes across processes. Waiting for the
+    lock blocks, so the event loop goes through `take_async`, which runs it in a thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=1, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+
+    def take(self, requests: List[BucketRequest], consume: bool = True) -> float:
+        """
+        See `MemoryBucketStore.take`.
+        """
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                levels = []
+                wait = 0.0
+                for key, amount, rate, capacity in requests:
+                    row = connection.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                    tokens = _refill(row[0], row[1], now, rate, capacity) if row else capacity
+                    levels.append((key, tokens - amount))
+                    wait = max(wait, (amount - tokens) / rate)
+
+                if wait <= 0 and consume:
+                    connection.executemany("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                                           [(key, tokens, now) for key, tokens in levels])
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return max(wait, 0.0)
+
+    async def take_async(self, requests: List[BucketRequest], consume: bool = True) -> float:
+        """Same as `take`, run in a thread so waiting for the SQLite lock doesn't block the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.take, requests, consume)
+
+
+def get_bucket_store(location: str = RATE_LIMIT_STORE):
+    """
+    Opens the configured bucket store, falling back to an in-process one if the SQLite file can't be used.
+    """
+    if location == "memory":
+        return MemoryBucketStore()
+    try:
+        return SqliteBucketStore(location)
+    except sqlite3.Error:
+        logger.warning("Could not open rate limit store %s, limiting per process", location, exc_info=True)
+        return MemoryBucketStore()
+
+
+_store = None
+
+
+def bucket_store():
+    # Opened on first use, so importing this module touches no files
+    global _store
+    if _store is None:
+        _store = get_bucket_store()
+    return _store
+
+
+class RateLimiter:
+    """
+    Limits the requests and characters per second sent to a provider, with token buckets.
+
+    A rate of 0 means no limit.
+    """
+
+    def __init__(self, name: str, requests_per_second: float = 0, chars_per_second: float = 0,
+                 burst_seconds: float = RATE_LIMIT_BURST_SECONDS, store=None):
+        self.name = name
+        self.requests_per_second = requests_per_second
+        self.chars_per_second = chars_per_second
+        self.burst_seconds = burst_seconds
+        self._store = store
+        # Used when the shared store fails (e.g. its SQLite file stays locked)
+        self._fallback = MemoryBucketStore()
+        self.throttled = 0
+
+    @classmethod
+    def for_provider(cls, name: str) -> "RateLimiter":
+        """
+        Builds the limiter of a provider from its <NAME>_REQUESTS_PER_SECOND and <NAME>_CHARS_PER_SECOND settings.
+        """
+        prefix = name.upper()
+        return cls(name,
+                   requests_per_second=float(os.environ.get(f"{prefix}_REQUESTS_PER_SECOND", 0)),
+                   chars_per_second=float(os.environ.get(f"{prefix}_CHARS_PER_SECOND", 0)))
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_second > 0 or self.chars_per_second > 0
+
+    @property
+    def store(self):
+        return self._store or bucket_store()
+
+    def _requests(self, chars: int) -> List[BucketRequest]:
+        requests = []
+        for kind, rate, amount in (("requests", self.requests_per_second, 1), ("chars", self.chars_per_second, chars)):
+            if rate > 0:
+                capacity = max(rate * self.burst_seconds, 1)
+                # A call larger than the bucket could never go through, it waits for a full bucket instead
+                requests.append((f"{self.name}:{kind}", min(amount, capacity), rate, capacity))
+        return requests
+
+    async def _take(self, requests: List[BucketRequest], consume: bool = True) -> float:
+        try:
+            return await self.store.take_async(requests, consume)
+        except sqlite3.Error:
+            # A locked or unreadable store shouldn't fail the request, the limit is kept per process meanwhile
+            logger.warning("Rate limit store failed, limiting %s per process", self.name, exc_info=True)
+            return await self._fallback.take_async(requests, consume)
+
+    async def wait_time(self, chars: int) -> float:
+        """
+        Returns how long a call of `chars` characters would wait for quota right now, without taking any.
+        """
+        if not self.enabled:
+            return 0.0
+        return await self._take(self._requests(chars), consume=False)
+
+    async def acquire(self, chars: int, max_wait: float) -> float:
+        """
+        Waits until a call of `chars` characters fits in the limits, and takes its quota.
+
+        Args:
+            chars (int): The characters the call sends.
+            max_wait (float): The longest the call may wait, in seconds.
+
+        Returns:
+            float: 0 once the quota is taken, or the expected wait if it is longer than `max_wait` (nothing is taken).
+        """
+        if not self.enabled:
+            return 0.0
+
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = await self._take(self._requests(chars))
+            if wait <= 0:
+                return 0.0
+            if time.monotonic() + wait > deadline:
+                self.throttled += 1
+                return wait
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        return {
+            "requests_per_second": self.requests_per_second,
+            "chars_per_second": self.chars_per_second,
+            "throttled": self.throttled,
+        }
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request should be turned away rather than wait for the provider."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Admission control for requests that call the translation provider.
+
+    Requests are turned away up front when the provider quota would make them wait longer than `max_wait`.
+    At most `max_in_flight` requests call the provider at once. The others wait in one queue per user,
+    and freed slots go to the users in turn, so a user sending many requests can't starve the others.
+    """
+
+    def __init__(self, provider, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+                 max_queued_per_user: int = ADMISSION_MAX_QUEUED_PER_USER, max_wait: float = ADMISSION_MAX_WAIT):
+        self.provider = provider
+        self.max_in_flight = max_in_flight
+        self.max_queued_per_user = max_queued_per_user
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._waiters: Dict[int, deque] = {}
+        # Users with waiting requests, in the order their turn comes
+        self._turns = deque()
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[int], chars: int):
+        """
+        Holds a provider slot for a user's request.
+
+        Args:
+            user_id (Optional[int]): The user making the request. None for internal callers, which are not limited.
+            chars (int): The characters the request will send to the provider.
+
+        Raises:
+            AdmissionRejected: If the provider quota is exhausted, or the user has too many requests waiting.
+        """
+        if user_id is None or self.max_in_flight <= 0:
+            yield
+            return
+
+        wait = await self.provider.quota_wait(chars)
+        if wait > self.max_wait:
+            self.rejected += 1
+            raise AdmissionRejected("Translation quota exhausted", retry_after=wait)
+
+        await self._acquire(user_id)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, user_id: int):
+        if self.in_flight < self.max_in_flight and not self._turns:
+            self.in_flight += 1
+            return
+
+        # Checked before the queue is created, so no user is ever left in turn with an empty queue
+        queue = self._waiters.get(user_id)
+        if len(queue or ()) >= self.max_queued_per_user:
+            self.rejected += 1
+            raise AdmissionRejected("Too many requests waiting", retry_after=self.max_wait)
+        if queue is None:
+            queue = self._waiters[user_id] = deque()
+            self._turns.append(user_id)
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            # The slot is handed over by _release, in_flight already counts it
+            await asyncio.wait_for(waiter, timeout=self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as we gave up, pass it on
+                self._release()
+            else:
+                self._forget(user_id, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise AdmissionRejected("Too many requests waiting", retry_after=self.max_wait) from e
+            raise
+
+    def _forget(self, user_id: int, waiter: asyncio.Future):
+        queue = self._waiters.get(user_id)
+        if queue is None:
+            return
+        if waiter in queue:
+            queue.remove(waiter)
+        if not queue:
+            del self._waiters[user_id]
+            self._turns.remove(user_id)
+
+    def _release(self):
+        # Hand the slot to the next user in turn rather than freeing it
+        while self._turns:
+            user_id = self._turns.popleft()
+            queue = self._waiters[user_id]
+            waiter = queue.popleft()
+            if queue:
+                self._turns.append(user_id)
+            else:
+                del self._waiters[user_id]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "waiting": sum(len(queue) for queue in self._waiters.values()),
+            "waiting_users": len(self._waiters),
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,54 @@
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from typing import NamedTuple, Optional
+import hashlib
+
+try:
+    # orjson serializes several times faster than the standard library
+    import orjson
+    from fastapi.responses import ORJSONResponse as JSONResponse
+
+    def dumps(content) -> str:
+        return orjson.dumps(content).decode("utf-8")
+
+except ImportError:
+    from fastapi.responses import JSONResponse
+    import json
+
+    def dumps(content) -> str:
+        return json.dumps(content)
+
+
+class CachedResponse(NamedTuple):
+    """A rendered JSON response kept for conditional GETs, with the user allowed to read it."""
+    owner_id: int
+    body: bytes
+    etag: str
+
+
+def cached_response(owner_id: int, content) -> CachedResponse:
+    """
+    Renders content the way the endpoint would, and tags it with a strong ETag (a digest of the body).
+    """
+    body = JSONResponse(jsonable_encoder(content)).body
+    return CachedResponse(owner_id, body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"')
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def conditional_response(cached: CachedResponse, if_none_match: Optional[str]) -> Response:
+    """
+    Answers 304 Not Modified, with no body, if the client already has this version, otherwise sends the body.
+    """
+    # Clients must revalidate, and shared caches must not store per-user responses
+    headers = {"ETag": cached.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(cached.etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
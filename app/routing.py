@@ -0,0 +1,259 @@
+from app.metrics import LatencyWindow
+from app.providers import TranslationProvider, ProviderError, ProviderRateLimited, ProviderRejected
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Recent calls kept per provider and language pair to estimate latency
+ROUTER_LATENCY_WINDOW = int(os.environ.get("ROUTER_LATENCY_WINDOW", 200))
+# A slow call is hedged once it takes longer than this quantile of its provider's latency
+HEDGE_QUANTILE = float(os.environ.get("HEDGE_QUANTILE", 0.95))
+# Calls observed before a provider's latency is trusted for hedging
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", 20))
+# Consecutive failures that open a provider's circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", 30))
+
+
+class CircuitBreaker:
+    """
+    Stops sending calls to a failing provider.
+
+    The circuit opens after `failure_threshold` consecutive failures. Once `reset_seconds` have passed,
+    a single trial call is let through (half-open): its success closes the circuit, its failure reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+
+    def available(self) -> bool:
+        """
+        Tells whether a call could be sent now, without changing the state.
+        """
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_seconds
+        # Half-open: the trial call is already in flight
+        return False
+
+    def acquire(self) -> bool:
+        """
+        Claims the right to send a call. An open circuit past its reset time becomes half-open for the trial call.
+        """
+        if not self.available():
+            return False
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_cancel(self):
+        # A cancelled trial proves nothing, let the next call try again
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "times_opened": self.times_opened}
+
+
+class ProviderRouter(TranslationProvider):
+    """
+    Spreads translations over several providers.
+
+    For each language pair, calls go to the available provider with the lowest observed median latency.
+    A call still running past its provider's p95 (HEDGE_QUANTILE) is hedged: the same call is sent to the
+    next provider and the first answer wins. A failed call fails over to the next provider right away,
+    and providers that keep failing are skipped by a circuit breaker until they recover.
+    """
+
+    name = "router"
+
+    def __init__(self, providers: List[TranslationProvider], latency_window: int = ROUTER_LATENCY_WINDOW,
+                 hedge_quantile: float = HEDGE_QUANTILE, hedge_min_samples: int = HEDGE_MIN_SAMPLES):
+        super().__init__()
+        self.providers = providers
+        # Calls are bounded by each provider, and segments are split by each provider
+        self.max_batch_size = max(provider.max_batch_size for provider in providers)
+        self.max_batch_chars = max(provider.max_batch_chars for provider in providers)
+        self.latency_window = latency_window
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.breakers = {provider.name: CircuitBreaker() for provider in providers}
+        self._latencies: Dict[Tuple[str, str, str], LatencyWindow] = {}
+        self._languages: Dict[str, frozenset] = {}
+        self.hedges = 0
+        self.hedges_won = 0
+        self.failovers = 0
+
+    def get_languages(self) -> List[str]:
+        """
+        Returns the languages supported by at least one provider. Providers that cannot be reached are skipped.
+        """
+        for provider in self.providers:
+            try:
+                self._languages[provider.name] = frozenset(provider.get_languages())
+            except Exception:
+                logger.warning("Could not load the languages of provider %s", provider.name, exc_info=True)
+
+        if not self._languages:
+            raise ProviderError("No translation provider could list its languages")
+        return sorted(set().union(*self._languages.values()))
+
+    def _latency(self, provider: TranslationProvider, source: Optional[str], target: str) -> LatencyWindow:
+        key = (provider.name, source or "auto", target)
+        if key not in self._latencies:
+            self._latencies[key] = LatencyWindow(self.latency_window)
+        return self._latencies[key]
+
+    def _supports(self, provider: TranslationProvider, source: Optional[str], target: str) -> bool:
+        languages = self._languages.get(provider.name)
+        # Providers whose languages are unknown are given a chance
+        if languages is None:
+            return True
+        return target in languages and (source is None or source in languages)
+
+    def _candidates(self, source: Optional[str], target: str) -> List[TranslationProvider]:
+        """
+        Returns the providers able to take a call for this language pair, fastest first.
+        Providers without latency data yet sort first, so every provider gets measured.
+        """
+        candidates = [provider for provider in self.providers if self._supports(provider, source, target)]
+
+        def median(provider):
+            return self._latency(provider, source, target).quantile(0.5) or 0.0
+
+        return [provider for provider in sorted(candidates, key=median) if self.breakers[provider.name].available()]
+
+    def _hedge_delay(self, provider: TranslationProvider, source: Optional[str], target: str) -> Optional[float]:
+        latency = self._latency(provider, source, target)
+        if len(latency) < self.hedge_min_samples:
+            return None
+        return latency.quantile(self.hedge_quantile)
+
+    async def _attempt(self, provider: TranslationProvider, texts: List[str], source: Optional[str], target: str) -> List[Tuple[str, str]]:
+        breaker = self.breakers[provider.name]
+        if not breaker.acquire():
+            raise ProviderError(f"{provider.name} circuit is open")
+
+        start = time.monotonic()
+        try:
+            result = await provider.translate_batch(texts, source, target)
+        except asyncio.CancelledError:
+            # Lost a hedge: the call took at least this long
+            breaker.record_cancel()
+            self._latency(provider, source, target).observe(time.monotonic() - start)
+            raise
+        except ProviderRejected:
+            # The provider answered, the call was at fault: not a sign of an unhealthy provider
+            breaker.record_success()
+            raise
+        except ProviderRateLimited as e:
+            if e.retryable:
+                breaker.record_failure()
+            else:
+                # Our own rate limit turned the call away before it reached the provider
+                breaker.record_cancel()
+            raise
+        except ProviderError:
+            breaker.record_failure()
+            raise
+
+        breaker.record_success()
+        self._latency(provider, source, target).observe(time.monotonic() - start)
+        return result
+
+    async def _call(self, texts: List[str], source: Optional[str], target: str) -> List[Tuple[str, str]]:
+        remaining = self._candidates(source, target)
+        if not remaining:
+            raise ProviderError(f"No translation provider available for {source or 'auto'}->{target}")
+
+        primary = remaining.pop(0)
+        in_flight = {asyncio.ensure_future(self._attempt(primary, texts, source, target)): primary}
+        # Hedge at most once per call, so a slow spell doesn't double the load on every provider
+        delay = self._hedge_delay(primary, source, target) if remaining else None
+        hedge = None
+        error = None
+        try:
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedges += 1
+                    hedge = remaining.pop(0)
+                    in_flight[asyncio.ensure_future(self._attempt(hedge, texts, source, target))] = hedge
+                    delay = None
+                    continue
+
+                for task in done:
+                    provider = in_flight.pop(task)
+                    if task.exception() is None:
+                        if provider is hedge:
+                            self.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+                    # Another provider would reject the same call
+                    if isinstance(error, ProviderRejected):
+                        raise error
+
+                if not in_flight and remaining:
+                    self.failovers += 1
+                    fallback = remaining.pop(0)
+                    in_flight[asyncio.ensure_future(self._attempt(fallback, texts, source, target))] = fallback
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+        raise error
+
+    async def quota_wait(self, chars: int) -> float:
+        # Any provider with quota left can take the call
+        return min(await asyncio.gather(*(provider.quota_wait(chars) for provider in self.providers)))
+
+    def stats(self) -> dict:
+        latencies = {}
+        for (name, source, target), window in self._latencies.items():
+            latencies.setdefault(name, {})[f"{source}->{target}"] = {
+                "calls": len(window),
+                "p50": window.quantile(0.5),
+                "p95": window.quantile(0.95),
+            }
+
+        return {
+            "provider": self.name,
+            "providers": {
+                provider.name: {
+                    "circuit": self.breakers[provider.name].stats(),
+                    "latency": latencies.get(provider.name, {}),
+                    "retries": provider.retries,
+                    "rate_limit": provider.limiter.stats(),
+                }
+                for provider in self.providers
+            },
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "failovers": self.failovers,
+        }
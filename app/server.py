@@ -0,0 +1,41 @@
+"""
+Production entry point: python -m app.server
+
+Runs the API on several worker processes with uvloop and httptools, without the reloader.
+Use `uvicorn app.api.main:app --reload` for development instead.
+"""
+import multiprocessing
+import os
+import uvicorn
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 8000))
+# Worker processes, one per core by default
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Seconds in-flight requests get to finish on shutdown
+GRACEFUL_SHUTDOWN_TIMEOUT = float(os.environ.get("GRACEFUL_SHUTDOWN_TIMEOUT", 30))
+# Seconds an idle keep-alive connection stays open, longer than typical load balancer idle timeouts
+KEEP_ALIVE_TIMEOUT = int(os.environ.get("KEEP_ALIVE_TIMEOUT", 75))
+# Comma-separated proxy addresses whose X-Forwarded-For and X-Forwarded-Proto headers are trusted
+FORWARDED_ALLOW_IPS = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+
+def main():
+    uvicorn.run(
+        "app.api.main:app",
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        loop="uvloop",
+        http="httptools",
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT,
+        timeout_keep_alive=KEEP_ALIVE_TIMEOUT,
+        # Behind a load balancer, take the client address from X-Forwarded-For, if the balancer is trusted
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+        server_header=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
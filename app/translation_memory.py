@@ -0,0 +1,224 @@
+from app.cache import LRUCache
+from app.crud import get_translation_by_digest, get_translations_by_digests, get_similar_translation, has_trigram_index
+from app.utils import translate_text, admission
+from app.chunking import translate_document, DOCUMENT_CHUNK_CHARS
+from app.database import release_connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import os
+import unicodedata
+
+# In-process tier sizing. Entries are small (a translation and a language code).
+TM_CACHE_SIZE = int(os.environ.get("TM_CACHE_SIZE", 50000))
+TM_CACHE_TTL = float(os.environ.get("TM_CACHE_TTL", 3600))
+# Trigram similarity (0 to 1) above which a past translation of a near-identical text is suggested. 0 disables fuzzy matching.
+# Punctuation and case don't count, so 1 still matches texts differing only in those.
+FUZZY_MATCH_THRESHOLD = float(os.environ.get("FUZZY_MATCH_THRESHOLD", 0.9))
+# Longer texts are only matched exactly
+FUZZY_MATCH_MAX_CHARS = int(os.environ.get("FUZZY_MATCH_MAX_CHARS", 1000))
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text so trivially different submissions share a translation memory entry.
+
+    Applies unicode NFC normalization and collapses runs of whitespace.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_digest(source: Optional[str], target: str, text: str) -> str:
+    """
+    Computes the translation memory key for a (source, target, text) triple.
+
+    Args:
+        source (Optional[str]): The requested source language, None when it should be detected.
+        target (str): The target language.
+        text (str): The text to translate.
+
+    Returns:
+        str: A hex SHA-256 digest of the normalized triple.
+    """
+    key = "\x1f".join((source or "auto", target, normalize_text(text)))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class TranslationMemory:
+    """
+    Translation memory checked before any provider call.
+
+    Exact lookups go to an in-process LRU first and fall back to past `translation_tasks` rows,
+    which are indexed by their text digest. On exact misses, the user's most similar past text is found
+    through a pg_trgm index, and its translation is offered as a suggestion next to the fresh one.
+    """
+
+    def __init__(self, maxsize: int = TM_CACHE_SIZE, ttl: float = TM_CACHE_TTL,
+                 fuzzy_threshold: float = FUZZY_MATCH_THRESHOLD, fuzzy_max_chars: int = FUZZY_MATCH_MAX_CHARS):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_max_chars = fuzzy_max_chars
+        # Whether the trigram index exists, checked on the first fuzzy lookup
+        self._fuzzy_available: Optional[bool] = None
+        self.hits = 0
+        self.misses = 0
+        # Exact misses for which a fuzzy match was suggested
+        self.fuzzy_hits = 0
+
+    async def get(self, session: AsyncSession, digest: str) -> Optional[Tuple[str, str]]:
+        """
+        Looks up a past translation.
+
+        Args:
+            session (AsyncSession): The database session.
+            digest (str): The key produced by `text_digest`.
+
+        Returns:
+            Optional[Tuple[str, str]]: The translated text and its source language, or None.
+        """
+        cached = self._cache.get(digest)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        task = await get_translation_by_digest(session, digest)
+        if task is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        result = (task.translated_text, task.source_language)
+        self._cache.set(digest, result)
+        return result
+
+    async def get_many(self, session: AsyncSession, digests: List[str]) -> Dict[str, Tuple[str, str]]:
+        """
+        Looks up past translations for several keys, querying the database once for all in-process misses.
+
+        Args:
+            session (AsyncSession): The database session.
+            digests (List[str]): Keys produced by `text_digest`.
+
+        Returns:
+            Dict[str, Tuple[str, str]]: The translated text and source language for each key found.
+        """
+        unique = set(digests)
+        found = {}
+        missing = []
+        for digest in unique:
+            cached = self._cache.get(digest)
+            if cached is not None:
+                found[digest] = cached
+            else:
+                missing.append(digest)
+
+        if missing:
+            stored = await get_translations_by_digests(session, missing)
+            for digest, result in stored.items():
+                self._cache.set(digest, result)
+            found.update(stored)
+
+        self.hits += len(found)
+        self.misses += len(unique) - len(found)
+        return found
+
+    async def get_similar(self, session: AsyncSession, user_id: int, source: Optional[str], target: str,
+                          text: str) -> Optional[Tuple[str, float]]:
+        """
+        Looks up the user's past translation of the most similar text, for an exact miss.
+
+        Fuzzy matches are not cached in process: they depend on the texts stored so far, and the
+        indexed lookup takes a few milliseconds.
+
+        Args:
+            session (AsyncSession): The database session.
+            user_id (int): The user making the request. Only their own tasks are searched.
+            source (Optional[str]): The requested source language, None when it should be detected.
+            target (str): The target language.
+            text (str): The text to translate.
+
+        Returns:
+            Optional[Tuple[str, float]]: The past translation and the similarity of its text, or None if
+            no text is similar enough.
+        """
+        if self.fuzzy_threshold <= 0 or len(text) > self.fuzzy_max_chars:
+            return None
+        if self._fuzzy_available is None:
+            self._fuzzy_available = await has_trigram_index(session)
+        if not self._fuzzy_available:
+            return None
+
+        match = await get_similar_translation(session, user_id, source, target, text)
+        if match is None or match.score < self.fuzzy_threshold:
+            return None
+
+        self.fuzzy_hits += 1
+        return (match.translated_text, match.score)
+
+    def put(self, digest: str, translated_text: str, source_language: str):
+        """
+        Stores a fresh translation in the in-process tier.
+
+        The persistent tier is the translation task row itself, written by the caller.
+        """
+        self._cache.set(digest, (translated_text, source_language))
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "fuzzy_hits": self.fuzzy_hits,
+            "memory": self._cache.stats(),
+        }
+
+
+translation_memory = TranslationMemory()
+
+
+async def translate_with_memory(session: AsyncSession, source: Optional[str], target: str, text: str,
+                                user_id: Optional[int] = None) -> Tuple[str, str, str, Optional[Tuple[Optional[str], float]]]:
+    """
+    Translates text, reusing a past translation of the same text when there is one.
+
+    Otherwise the text is translated, and the user's past translation of a near-identical text, if any, is
+    returned alongside as a suggestion: a similar text may still differ in a name, a number or a negation.
+
+    Large documents go through the chunked pipeline in app/chunking.py.
+
+    Args:
+        session (AsyncSession): The database session.
+        source (Optional[str]): The requested source language, None when it should be detected.
+        target (str): The target language.
+        text (str): The text to translate.
+        user_id (Optional[int]): The user making the request, whose provider calls go through admission control
+            and whose past translations are searched for suggestions. None skips both.
+
+    Returns:
+        Tuple[str, str, str, Optional[Tuple[Optional[str], float]]]: The translated text, its source language, its
+        translation memory key, and the translation memory match: (None, 1.0) for an exact match, the suggested
+        translation and its similarity for a fuzzy one, None otherwise.
+
+    Raises:
+        AdmissionRejected: If the request should be retried later rather than wait for the provider.
+    """
+    digest = text_digest(source, target, text)
+    cached = await translation_memory.get(session, digest)
+
+    if cached:
+        (translated_text, source_language) = cached
+        return (translated_text, source_language, digest, (None, 1.0))
+
+    similar = None
+    if user_id is not None:
+        similar = await translation_memory.get_similar(session, user_id, source, target, text)
+
+    await release_connection(session)
+    async with admission.slot(user_id, len(text)):
+        if len(text) > DOCUMENT_CHUNK_CHARS:
+            # Too large for a single provider call
+            (translated_text, source_language) = await translate_document(source, target, text)
+        else:
+            (translated_text, source_language) = await translate_text(source, target, text)
+    translation_memory.put(digest, translated_text, source_language)
+
+    return (translated_text, source_language, digest, similar)
@@ -1,12 +1,56 @@
-from google.cloud import translate_v2 as translate
 from fastapi import HTTPException
+from app.providers import get_provider, mock_translate, ProviderError, ProviderTimeout, ProviderRateLimited, ProviderRejected
+from app.ratelimit import AdmissionController
+from app.metrics import timed
+from app.batching import MicroBatcher
+from app.languages import LanguageRegistry, detection_cache, text_key
+from contextlib import contextmanager
+from typing import List, Optional
+import math
 import os
 
-translate_client = translate.Client()
+provider = get_provider()
 
-supported_languages = [item['language'] for item in translate_client.get_languages()]
+# Loaded on first use, not at import time
+supported_languages = LanguageRegistry(provider)
 
-def translate_text(source: str, target: str, text: str):
+# Merges concurrent single-text translations into provider batches
+batcher = MicroBatcher(provider.translate_batch)
+
+# Turns requests away before they burn provider quota, and shares provider slots fairly between users
+admission = AdmissionController(provider)
+
+async def check_languages(source: str, target: str):
+    """
+    Validates the language pair of a translation request.
+
+    Args:
+        source (str): The requested source language.
+        target (str): The requested target language.
+
+    Returns:
+        Optional[str]: The source language to send to the provider, None if it should be detected.
+
+    Raises:
+        HTTPException: 400 if the target language is not supported, 503 if the supported languages can't be loaded.
+    """
+    try:
+        languages = await supported_languages.load()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail="Supported languages are not available yet",
+                            headers={"Retry-After": retry_after(None)}) from e
+
+    # Check for valid target language
+    if target not in languages:
+        raise HTTPException(status_code=400, detail="Non-existing target language. Check input")
+
+    # If source language is not provided or is wrong, Translation API will try to detect it
+    if not source or source not in languages:
+        return None
+
+    return source
+
+async def translate_text(source: str, target: str, text: str):
     """Translates text into the target language.
 
     Target must be an ISO 639-1 language code.
@@ -16,21 +60,49 @@ def translate_text(source: str, target: str, text: str):
     if isinstance(text, bytes):
         text = text.decode("utf-8")
 
-    # Check for valid target language
-    if target not in supported_languages:
-        raise HTTPException(status_code=400, detail="Non-existing target language. Check input")
-    
-    
-    if not source or source not in supported_languages:
-        # If source language is not provided or is wrong, Translation API will try to detect it
-        result = translate_client.translate(text, target_language=target)
-        return (result["translatedText"], result["detectedSourceLanguage"])
+    source = await check_languages(source, target)
+
+    # Reuse the language detected the last time we saw this text
+    detect = source is None
+    if detect:
+        source = detection_cache.get(text_key(text))
+
+    with provider_errors(), timed("provider"):
+        if batcher.enabled:
+            result = await batcher.submit(text, source, target)
+        else:
+            result = await provider.translate(text, source, target)
+
+    if detect:
+        detection_cache.set(text_key(text), result[1])
+    return result
+
+async def translate_texts(source: str, target: str, texts: List[str]):
+    """Translates several texts sharing a language pair with as few provider calls as possible.
+
+    Returns a list of (translated text, source language) tuples, in the order of `texts`.
+    """
 
+    source = await check_languages(source, target)
 
-    result = translate_client.translate(text, source_language=source, target_language=target)
-    return (result["translatedText"], source)
-    
+    with provider_errors(), timed("provider"):
+        return await provider.translate_batch(texts, source, target)
 
+def retry_after(seconds: Optional[float]) -> str:
+    """Formats a delay for the Retry-After header, in whole seconds."""
+    return str(max(1, math.ceil(seconds or 1)))
 
-def mock_translate(text: str, target_language: str) -> str:
-    return f"{text} [Translated to {target_language}]"
+@contextmanager
+def provider_errors():
+    """Maps provider failures to HTTP errors."""
+    try:
+        yield
+    except ProviderRateLimited as e:
+        raise HTTPException(status_code=503, detail="Translation provider quota exceeded",
+                            headers={"Retry-After": retry_after(e.retry_after)}) from e
+    except ProviderTimeout as e:
+        raise HTTPException(status_code=504, detail="Translation provider timed out") from e
+    except ProviderRejected as e:
+        raise HTTPException(status_code=400, detail="Translation provider rejected the text") from e
+    except ProviderError as e:
+        raise HTTPException(status_code=502, detail="Translation provider error") from e
@@ -0,0 +1,129 @@
+from app.crud import claim_pending_tasks, complete_translation_task, fail_translation_task, retry_translation_task
+from app.translation_memory import translate_with_memory
+from app.database import async_session
+from app.providers import ProviderError
+from app.ratelimit import AdmissionRejected
+from fastapi import HTTPException
+from sqlalchemy.exc import DBAPIError
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Number of in-process workers draining queued tasks. Set to 0 to run them as separate processes (python -m app.workers).
+TASK_WORKERS = int(os.environ.get("TASK_WORKERS", 4))
+# Seconds an idle worker waits before polling the queue again
+TASK_POLL_INTERVAL = float(os.environ.get("TASK_POLL_INTERVAL", 1))
+# Seconds after which a task claimed by a worker that died is handed to another one
+TASK_LEASE_SECONDS = float(os.environ.get("TASK_LEASE_SECONDS", 300))
+# Claims of a task before it is marked as failed, when it keeps failing with transient errors (or its workers keep dying)
+TASK_MAX_ATTEMPTS = int(os.environ.get("TASK_MAX_ATTEMPTS", 5))
+# Seconds before the first retry of a task, doubling with each attempt
+TASK_RETRY_BASE_DELAY = float(os.environ.get("TASK_RETRY_BASE_DELAY", 5))
+
+
+def is_transient(error: Exception) -> bool:
+    """Tells whether a failed translation is worth retrying later."""
+    if isinstance(error, HTTPException):
+        # Provider failures reach the worker as the HTTP errors the API answers with
+        return error.status_code in (503, 504) or is_transient(error.__cause__)
+    if isinstance(error, ProviderError):
+        return error.retryable
+    return isinstance(error, (AdmissionRejected, DBAPIError, OSError, asyncio.TimeoutError))
+
+
+class TaskWorkerPool:
+    """
+    Background workers translating tasks queued with POST /tasks?async=true.
+
+    The queue is the translation_tasks table itself, so queued tasks survive restarts and can be
+    drained by workers in any process.
+    """
+
+    def __init__(self, size: int = TASK_WORKERS, poll_interval: float = TASK_POLL_INTERVAL,
+                 lease_seconds: float = TASK_LEASE_SECONDS, max_attempts: int = TASK_MAX_ATTEMPTS,
+                 retry_base_delay: float = TASK_RETRY_BASE_DELAY):
+        self.size = size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self._workers = []
+        self._wakeup = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.ensure_future(self._run()) for _ in range(self.size)]
+
+    async def serve(self):
+        """Runs the workers until cancelled, for standalone worker processes."""
+        self.start()
+        await asyncio.gather(*self._workers)
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def notify(self):
+        """Wakes idle workers up after a task is queued in this process."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await self._run_once()
+            except Exception:
+                # A worker must outlive any error, or the pool silently shrinks. Tasks left running are
+                # handed to another worker when their lease expires.
+                logger.exception("Translation worker iteration failed")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _run_once(self):
+        try:
+            async with async_session() as session:
+                tasks = await claim_pending_tasks(session, limit=1, lease_seconds=self.lease_seconds)
+        except Exception:
+            logger.exception("Failed to claim queued translation tasks")
+            tasks = []
+
+        if not tasks:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        for task in tasks:
+            await self._process(task)
+
+    async def _process(self, task):
+        async with async_session() as session:
+            try:
+                (translated_text, source_language, digest, _) = await translate_with_memory(
+                    session, task.source_language, task.target_language, task.text_to_translate)
+            except Exception as e:
+                if is_transient(e) and task.attempts < self.max_attempts:
+                    delay = self.retry_base_delay * 2 ** (task.attempts - 1)
+                    logger.warning("Translation task %s failed (attempt %s), retrying in %.0fs: %s",
+                                   task.id, task.attempts, delay, e)
+                    await retry_translation_task(session, task.id, delay, self.lease_seconds)
+                else:
+                    logger.exception("Translation task %s failed (attempt %s)", task.id, task.attempts)
+                    await fail_translation_task(session, task.id)
+                return
+
+            await complete_translation_task(session, task.id, source_language, translated_text, digest)
+
+
+task_workers = TaskWorkerPool()
+
+
+if __name__ == "__main__":
+    # Standalone worker process, started with: python -m app.workers
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(TaskWorkerPool(size=max(TASK_WORKERS, 1)).serve())
@@ -0,0 +1,246 @@
+"""
+Load test of the API with the mock translation provider.
+
+Each virtual user registers, logs in, then loops over the workload: create a task, list its tasks,
+rate the task and read the rating back. Part of the texts repeat, so the translation memory is exercised.
+Latency percentiles, throughput and database queries per request are reported per operation.
+
+By default the app runs in process (over an ASGI transport, against the database of DATABASE_URL), so
+database queries can be counted. --url drives a running server instead. The app needs Postgres,
+SQLite can't stand in for it (queue claims, upserts and migrations use Postgres-only SQL).
+
+Results are saved as JSON under bench/results/, named after the current commit, to compare runs:
+
+    python -m bench.load_test --concurrency 50 --iterations 20 [--provider-latency-ms 50]
+    python -m bench.load_test --compare bench/results/<before>.json bench/results/<after>.json
+"""
+import os
+
+# Must be set before the app is imported
+os.environ.setdefault("TRANSLATION_PROVIDER", "mock")
+
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+import uuid
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Queries counted for the request being made by the current virtual user
+_query_counter: ContextVar[Optional[list]] = ContextVar("query_counter", default=None)
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class Recorder:
+    """Collects the latency, status and query count of every request, per operation."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[tuple]] = {}
+
+    async def request(self, client, operation: str, method: str, url: str, expected=(200,), **kwargs):
+        counter = [0]
+        token = _query_counter.set(counter)
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.status_code in expected
+        except Exception:
+            response = None
+            ok = False
+        finally:
+            _query_counter.reset(token)
+        self.samples.setdefault(operation, []).append((time.perf_counter() - started, ok, counter[0]))
+        return response if ok else None
+
+    def report(self, elapsed: float, count_queries: bool) -> dict:
+        operations = {}
+        everything = []
+        for operation, samples in self.samples.items():
+            operations[operation] = self._summary(samples, elapsed, count_queries)
+            everything.extend(samples)
+        return {"total": self._summary(everything, elapsed, count_queries), "operations": operations}
+
+    @staticmethod
+    def _summary(samples: List[tuple], elapsed: float, count_queries: bool) -> dict:
+        latencies = sorted(latency for latency, _, _ in samples)
+        return {
+            "requests": len(samples),
+            "errors": sum(1 for _, ok, _ in samples if not ok),
+            "rps": len(samples) / elapsed if elapsed else None,
+            "p50_ms": _ms(percentile(latencies, 0.50)),
+            "p95_ms": _ms(percentile(latencies, 0.95)),
+            "p99_ms": _ms(percentile(latencies, 0.99)),
+            "queries_per_request": (sum(queries for _, _, queries in samples) / len(samples)
+                                    if count_queries and samples else None),
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def count_queries(engine):
+    """Counts the statements executed by the engine for the request in progress."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter = _query_counter.get()
+        if counter is not None:
+            counter[0] += 1
+
+
+async def virtual_user(client, recorder: Recorder, run: str, index: int, iterations: int, repeat_ratio: float):
+    username = f"load_{run}_{index}"
+    credentials = {"username": username, "password": "load-test"}
+    if await recorder.request(client, "register", "POST", "/register", json=credentials) is None:
+        return
+    response = await recorder.request(client, "login", "POST", "/login", json=credentials)
+    if response is None:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    for i in range(iterations):
+        # Repeated texts are shared by every user, the others are unique
+        if random.random() < repeat_ratio:
+            text = f"Common sentence number {random.randrange(100)}."
+        else:
+            text = f"Sentence {i} written by {username}."
+        response = await recorder.request(client, "create_task", "POST", "/tasks", headers=headers,
+                                          json={"source_language": "en", "target_language": "pt", "text_to_translate": text})
+        await recorder.request(client, "list_tasks", "GET", "/tasks", headers=headers, params={"limit": 50})
+        if response is None:
+            continue
+
+        task_id = response.json()["id"]
+        await recorder.request(client, "rate_task", "POST", f"/tasks/{task_id}/rate", headers=headers,
+                               json={"rating": random.randint(1, 5), "feedback": "load test"})
+        await recorder.request(client, "get_rating", "GET", f"/tasks/{task_id}/rate", headers=headers)
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args) -> dict:
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        queries = False
+    else:
+        from app.api.main import app
+        from app.database import async_engine
+
+        count_queries(async_engine)
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load-test", timeout=args.timeout)
+        queries = True
+
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    started = time.perf_counter()
+    try:
+        async with client:
+            await asyncio.gather(*(virtual_user(client, recorder, run_id, index, args.iterations, args.repeat_ratio)
+                                   for index in range(args.concurrency)))
+    finally:
+        elapsed = time.perf_counter() - started
+        if not args.url:
+            await app.router.shutdown()
+
+    return {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "iterations": args.iterations,
+            "repeat_ratio": args.repeat_ratio,
+            "provider": os.environ["TRANSLATION_PROVIDER"],
+            "provider_latency_ms": float(os.environ.get("MOCK_PROVIDER_LATENCY_MS", 0)),
+        },
+        "elapsed_s": round(elapsed, 3),
+        **recorder.report(elapsed, queries),
+    }
+
+
+def print_report(result: dict):
+    print(f"commit {result['commit']}  {result['elapsed_s']}s  {result['config']}")
+    print(f"{'operation':<12} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for name, summary in [("total", result["total"])] + sorted(result["operations"].items()):
+        print(f"{name:<12} {summary['requests']:>9} {summary['errors']:>7} {_fmt(summary['rps'])} "
+              f"{_fmt(summary['p50_ms'])} {_fmt(summary['p95_ms'])} {_fmt(summary['p99_ms'])} "
+              f"{_fmt(summary['queries_per_request'], 8)}")
+
+
+def _fmt(value: Optional[float], width: int = 9) -> str:
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.2f}"
+
+
+def compare(before_path: str, after_path: str):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    print(f"{before['commit']} -> {after['commit']}")
+    print(f"{'operation':<12} {'metric':<20} {'before':>10} {'after':>10} {'change':>8}")
+    names = ["total"] + sorted(set(before["operations"]) & set(after["operations"]))
+    for name in names:
+        old = before["total"] if name == "total" else before["operations"][name]
+        new = after["total"] if name == "total" else after["operations"][name]
+        for metric in ("rps", "p50_ms", "p95_ms", "p99_ms", "queries_per_request"):
+            if old[metric] is None or new[metric] is None:
+                continue
+            change = f"{(new[metric] - old[metric]) / old[metric] * 100:+.1f}%" if old[metric] else "-"
+            print(f"{name:<12} {metric:<20} {old[metric]:>10.2f} {new[metric]:>10.2f} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users running at the same time")
+    parser.add_argument("--iterations", type=int, default=10, help="workload loops per virtual user")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="share of texts repeated across users")
+    parser.add_argument("--provider-latency-ms", type=float, help="latency injected by the mock provider")
+    parser.add_argument("--url", help="base URL of a running server, instead of running the app in process")
+    parser.add_argument("--timeout", type=float, default=60, help="request timeout in seconds")
+    parser.add_argument("--output", help="where to save the JSON results (default: bench/results/<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two saved results and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.provider_latency_ms is not None:
+        os.environ["MOCK_PROVIDER_LATENCY_MS"] = str(args.provider_latency_ms)
+
+    result = asyncio.run(run(args))
+    print_report(result)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{result['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
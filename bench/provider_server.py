@@ -0,0 +1,73 @@
+"""
+A local stand-in for a remote translation service, speaking the protocol of `HttpProvider`.
+
+It translates like the mock provider and can be made slow or flaky, to exercise provider routing,
+hedging and circuit breaking without a real provider.
+
+Usage:
+    python -m bench.provider_server [--port 8001] [--latency-ms 50] [--jitter-ms 0] [--slow-rate 0] [--error-rate 0]
+
+Then run the app with TRANSLATION_PROVIDER=http,mock and HTTP_PROVIDER_URL=http://localhost:8001.
+"""
+from app.providers import MockProvider, mock_translate
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+import argparse
+import asyncio
+import random
+import uvicorn
+
+
+class Settings:
+    latency_ms = 50.0
+    jitter_ms = 0.0
+    # Share of calls taking ten times the usual latency, and of calls failing
+    slow_rate = 0.0
+    error_rate = 0.0
+
+
+class TranslateIn(BaseModel):
+    texts: List[str]
+    source: Optional[str] = None
+    target: str
+
+
+app = FastAPI()
+
+
+@app.get("/languages")
+async def languages():
+    return MockProvider.languages
+
+
+@app.post("/translate")
+async def translate(request: TranslateIn):
+    latency = Settings.latency_ms + random.uniform(0, Settings.jitter_ms)
+    if random.random() < Settings.slow_rate:
+        latency *= 10
+    await asyncio.sleep(latency / 1000)
+
+    if random.random() < Settings.error_rate:
+        raise HTTPException(status_code=503, detail="Stand-in provider failure")
+
+    return {"translations": [
+        {"translatedText": mock_translate(text, request.target), "detectedSourceLanguage": request.source or "en"}
+        for text in request.texts
+    ]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=Settings.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=Settings.jitter_ms)
+    parser.add_argument("--slow-rate", type=float, default=Settings.slow_rate)
+    parser.add_argument("--error-rate", type=float, default=Settings.error_rate)
+    args = parser.parse_args()
+
+    Settings.latency_ms = args.latency_ms
+    Settings.jitter_ms = args.jitter_ms
+    Settings.slow_rate = args.slow_rate
+    Settings.error_rate = args.error_rate
+    uvicorn.run(app, host="0.0.0.0", port=args.port)
@@ -0,0 +1,119 @@
+"""
+Shows the query plans of the hot database queries with and without the indexes added by migration 0002.
+
+The indexes are dropped inside a transaction that is rolled back, so the database is left untouched.
+
+Usage:
+    python -m bench.query_plans [--seed TASKS] [--users USERS]
+
+--seed first inserts TASKS synthetic translation tasks spread over USERS users, so the plans reflect a large table.
+"""
+from app.database import sync_engine
+from sqlalchemy import text
+import argparse
+import time
+
+# Indexes added for these queries, dropped for the "before" plans
+INDEXES = [
+    "ix_translation_tasks_user_id_id",
+    "ix_translation_tasks_text_digest",
+    "ix_translation_tasks_queue",
+    "ratings_translation_id_key",
+]
+
+QUERIES = {
+    "list tasks page (GET /tasks?cursor=&limit=100)": """
+        SELECT id, source_language, target_language, status FROM translation_tasks
+        WHERE user_id = :user_id AND id > :cursor ORDER BY id LIMIT 100
+    """,
+    "translation memory lookup": """
+        SELECT translated_text, source_language FROM translation_tasks WHERE text_digest = :digest LIMIT 1
+    """,
+    "task with rating (GET /tasks/{id}/rate)": """
+        SELECT * FROM translation_tasks LEFT OUTER JOIN ratings ON ratings.translation_id = translation_tasks.id
+        WHERE translation_tasks.id = :task_id AND translation_tasks.user_id = :user_id
+    """,
+    "rating by task": """
+        SELECT * FROM ratings WHERE translation_id = :task_id
+    """,
+    "claim queued task": """
+        SELECT id FROM translation_tasks WHERE status IN ('pending', 'running')
+        ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED
+    """,
+}
+
+SEED = [
+    """
+    INSERT INTO users (id, username, hashed_password)
+    SELECT nextval('user_id_seq'), 'bench_' || :tag || '_' || g, '' FROM generate_series(1, :users) g
+    """,
+    """
+    INSERT INTO translation_tasks (id, user_id, source_language, target_language, text_to_translate, translated_text, text_digest, status)
+    SELECT nextval('translation_task_id_seq'), u.first_id + g % :users, 'en', 'pt', 'text ' || g, 'texto ' || g,
+           encode(sha256(convert_to(:tag || g, 'UTF8')), 'hex'), 'done'
+    FROM generate_series(1, :tasks) g,
+         (SELECT min(id) AS first_id FROM users WHERE username LIKE 'bench_' || :tag || '_%') u
+    """,
+    """
+    INSERT INTO ratings (id, translation_id, rating)
+    SELECT nextval('ratings_id_seq'), id, 1 + id % 5 FROM translation_tasks
+    WHERE text_to_translate LIKE 'text %' AND id % 10 = 0
+    ON CONFLICT (translation_id) DO NOTHING
+    """,
+    "ANALYZE translation_tasks",
+    "ANALYZE ratings",
+]
+
+
+def sample_parameters(connection) -> dict:
+    # A busy user and one of their tasks in the middle of the table
+    row = connection.execute(text(
+        "SELECT user_id, id, text_digest FROM translation_tasks "
+        "WHERE text_digest IS NOT NULL ORDER BY id OFFSET (SELECT count(*) / 2 FROM translation_tasks) LIMIT 1"
+    )).first()
+    if row is None:
+        raise SystemExit("translation_tasks is empty, run with --seed")
+    return {"user_id": row.user_id, "cursor": row.id, "task_id": row.id, "digest": row.text_digest}
+
+
+def explain(connection, parameters: dict):
+    for name, query in QUERIES.items():
+        plan = connection.execute(text("EXPLAIN (ANALYZE, BUFFERS) " + query), parameters).scalars().all()
+        print(f"--- {name}")
+        print("\n".join(plan))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="synthetic translation tasks to insert first")
+    parser.add_argument("--users", type=int, default=100, help="users the synthetic tasks are spread over")
+    args = parser.parse_args()
+
+    if args.seed:
+        with sync_engine.begin() as connection:
+            started = time.perf_counter()
+            # One tag for the whole seed, so every statement sees the users created by the first one
+            parameters = {"tag": str(int(time.time())), "users": args.users, "tasks": args.seed}
+            for statement in SEED:
+                connection.execute(text(statement), parameters)
+            print(f"Seeded {args.seed} tasks in {time.perf_counter() - started:.1f}s")
+
+    with sync_engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            parameters = sample_parameters(connection)
+
+            print("========== AFTER (with indexes)")
+            explain(connection, parameters)
+
+            for index in INDEXES:
+                connection.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+            print("========== BEFORE (without indexes)")
+            explain(connection, parameters)
+        finally:
+            transaction.rollback()
+
+
+if __name__ == "__main__":
+    main()
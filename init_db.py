@@ -1,4 +1,7 @@
 from app.database import sync_engine
-from app.models import Base
+from app.migrations import migrate
+import logging
 
-Base.metadata.create_all(bind=sync_engine)
\ No newline at end of file
+# Brings the database schema up to date, see migrations/
+logging.basicConfig(level=logging.INFO)
+migrate(sync_engine)
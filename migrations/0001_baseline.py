@@ -0,0 +1,93 @@
+"""Baseline schema. Creates it on an empty database and upgrades databases created by the old init_db.py create_all."""
+from sqlalchemy import text
+
+
+STATEMENTS = [
+    # Sequences used by the ORM for primary keys
+    "CREATE SEQUENCE IF NOT EXISTS user_id_seq",
+    "CREATE SEQUENCE IF NOT EXISTS translation_task_id_seq",
+    "CREATE SEQUENCE IF NOT EXISTS ratings_id_seq",
+    "CREATE SEQUENCE IF NOT EXISTS blacklisted_token_id_seq",
+
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER NOT NULL PRIMARY KEY,
+        username VARCHAR(50),
+        hashed_password VARCHAR
+    )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+
+    """
+    CREATE TABLE IF NOT EXISTS translation_tasks (
+        id INTEGER NOT NULL PRIMARY KEY,
+        user_id INTEGER REFERENCES users (id),
+        source_language VARCHAR(5),
+        target_language VARCHAR(5) NOT NULL,
+        text_to_translate VARCHAR NOT NULL,
+        translated_text VARCHAR
+    )
+    """,
+    # Translation memory and queued tasks
+    "ALTER TABLE translation_tasks ADD COLUMN IF NOT EXISTS text_digest VARCHAR(64)",
+    "ALTER TABLE translation_tasks ADD COLUMN IF NOT EXISTS status VARCHAR(10) NOT NULL DEFAULT 'done'",
+    "ALTER TABLE translation_tasks ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITHOUT TIME ZONE",
+    "ALTER TABLE translation_tasks ALTER COLUMN source_language DROP NOT NULL",
+    "ALTER TABLE translation_tasks ALTER COLUMN translated_text DROP NOT NULL",
+    "CREATE INDEX IF NOT EXISTS ix_translation_tasks_text_digest ON translation_tasks (text_digest)",
+    "CREATE INDEX IF NOT EXISTS ix_translation_tasks_status ON translation_tasks (status)",
+
+    """
+    CREATE TABLE IF NOT EXISTS ratings (
+        id INTEGER NOT NULL PRIMARY KEY,
+        translation_id INTEGER REFERENCES translation_tasks (id),
+        rating INTEGER NOT NULL,
+        feedback VARCHAR
+    )
+    """,
+    # One rating per task. Keep the oldest rating of tasks that were rated twice before this was enforced.
+    "DELETE FROM ratings a USING ratings b WHERE a.translation_id = b.translation_id AND a.id > b.id",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ratings_translation_id_key ON ratings (translation_id)",
+
+    """
+    CREATE TABLE IF NOT EXISTS blacklisted_tokens (
+        id INTEGER NOT NULL PRIMARY KEY,
+        token_hash VARCHAR(64),
+        expires_at TIMESTAMP WITHOUT TIME ZONE
+    )
+    """,
+]
+
+# Blacklists stored full tokens before. Hash them, and since their expiry is unknown, keep them for the
+# maximum token lifetime (ACCESS_TOKEN_EXPIRE_MINUTES).
+UPGRADE_BLACKLIST = [
+    "ALTER TABLE blacklisted_tokens ADD COLUMN IF NOT EXISTS token_hash VARCHAR(64)",
+    "ALTER TABLE blacklisted_tokens ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP WITHOUT TIME ZONE",
+    """
+    UPDATE blacklisted_tokens
+    SET token_hash = encode(sha256(convert_to(token, 'UTF8')), 'hex'),
+        expires_at = (now() AT TIME ZONE 'utc') + interval '30 minutes'
+    """,
+    "ALTER TABLE blacklisted_tokens DROP COLUMN token",
+]
+
+FINISH_BLACKLIST = [
+    "ALTER TABLE blacklisted_tokens ALTER COLUMN token_hash SET NOT NULL",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_blacklisted_tokens_token_hash ON blacklisted_tokens (token_hash)",
+    "CREATE INDEX IF NOT EXISTS ix_blacklisted_tokens_expires_at ON blacklisted_tokens (expires_at)",
+]
+
+
+def upgrade(connection):
+    for statement in STATEMENTS:
+        connection.execute(text(statement))
+
+    has_token_column = connection.execute(text(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = 'blacklisted_tokens' AND column_name = 'token'"
+    )).scalar()
+    if has_token_column:
+        for statement in UPGRADE_BLACKLIST:
+            connection.execute(text(statement))
+
+    for statement in FINISH_BLACKLIST:
+        connection.execute(text(statement))
@@ -0,0 +1,33 @@
+"""Indexes for listing tasks, translation memory lookups and the task queue, plus translation_tasks.created_at."""
+from sqlalchemy import text
+
+
+# Indexes are built without locking the table against writes, which needs autocommit. A failed CONCURRENTLY
+# build leaves an invalid index behind, so each one is dropped first and the migration can simply be re-run.
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    "ALTER TABLE translation_tasks ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()",
+
+    # Keyset pagination of a user's tasks (WHERE user_id = ? AND id > ? ORDER BY id) becomes an index range scan
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_translation_tasks_user_id_id",
+    "CREATE INDEX CONCURRENTLY ix_translation_tasks_user_id_id ON translation_tasks (user_id, id)",
+
+    # Translation memory lookups are equality-only on the digest, which already covers (source, target, text).
+    # A hash index is smaller than a B-tree on 64-character keys. It is built next to the B-tree and renamed
+    # once that is dropped, so lookups are never left without an index.
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_translation_tasks_text_digest_hash",
+    "CREATE INDEX CONCURRENTLY ix_translation_tasks_text_digest_hash ON translation_tasks USING hash (text_digest)",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_translation_tasks_text_digest",
+    "ALTER INDEX ix_translation_tasks_text_digest_hash RENAME TO ix_translation_tasks_text_digest",
+
+    # Workers only look for pending/running tasks, a tiny fraction of the table once it is large
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_translation_tasks_queue",
+    "CREATE INDEX CONCURRENTLY ix_translation_tasks_queue ON translation_tasks (id) WHERE status IN ('pending', 'running')",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_translation_tasks_status",
+]
+
+
+def upgrade(connection):
+    for statement in STATEMENTS:
+        connection.execute(text(statement))
@@ -0,0 +1,18 @@
+"""Index on when each user's queued tasks were last claimed, used to serve users in turn."""
+from sqlalchemy import text
+
+
+# Built without blocking writes, see 0002
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    # Only queued tasks are ever claimed, so the index stays small
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_translation_tasks_user_id_claimed_at",
+    "CREATE INDEX CONCURRENTLY ix_translation_tasks_user_id_claimed_at ON translation_tasks (user_id, claimed_at) "
+    "WHERE claimed_at IS NOT NULL",
+]
+
+
+def upgrade(connection):
+    for statement in STATEMENTS:
+        connection.execute(text(statement))
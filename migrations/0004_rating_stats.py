@@ -0,0 +1,39 @@
+"""Per language pair rating summary, backfilled from the existing ratings."""
+from sqlalchemy import text
+
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS rating_stats (
+        source_language VARCHAR(5) NOT NULL,
+        target_language VARCHAR(5) NOT NULL,
+        rating_count INTEGER NOT NULL DEFAULT 0,
+        rating_sum BIGINT NOT NULL DEFAULT 0,
+        rating_1 INTEGER NOT NULL DEFAULT 0,
+        rating_2 INTEGER NOT NULL DEFAULT 0,
+        rating_3 INTEGER NOT NULL DEFAULT 0,
+        rating_4 INTEGER NOT NULL DEFAULT 0,
+        rating_5 INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (source_language, target_language)
+    )
+    """,
+
+    # One-off backfill. From now on the application keeps the table up to date.
+    "DELETE FROM rating_stats",
+    """
+    INSERT INTO rating_stats
+    SELECT t.source_language, t.target_language, count(*), sum(r.rating),
+           count(*) FILTER (WHERE r.rating = 1), count(*) FILTER (WHERE r.rating = 2),
+           count(*) FILTER (WHERE r.rating = 3), count(*) FILTER (WHERE r.rating = 4),
+           count(*) FILTER (WHERE r.rating = 5)
+    FROM ratings r
+    JOIN translation_tasks t ON t.id = r.translation_id
+    WHERE t.source_language IS NOT NULL
+    GROUP BY t.source_language, t.target_language
+    """,
+]
+
+
+def upgrade(connection):
+    for statement in STATEMENTS:
+        connection.execute(text(statement))
@@ -0,0 +1,30 @@
+"""Trigram index over the texts of finished tasks, for fuzzy translation memory lookups."""
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Built without blocking writes, see 0002
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # GiST rather than GIN so the closest text can be found with an ordered index scan (<->).
+    # Tasks imported without a digest are left out, as they are from exact lookups.
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_translation_tasks_text_trgm",
+    "CREATE INDEX CONCURRENTLY ix_translation_tasks_text_trgm ON translation_tasks "
+    "USING gist (text_to_translate gist_trgm_ops) WHERE status = 'done' AND text_digest IS NOT NULL",
+]
+
+
+def upgrade(connection):
+    # pg_trgm ships with the contrib modules, which some Postgres builds leave out
+    if connection.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first() is None:
+        logger.warning("pg_trgm is not available, fuzzy translation memory lookups are disabled. Install the Postgres "
+                       "contrib modules and run the statements of migrations/0005_fuzzy_memory.py and "
+                       "0009_fuzzy_memory_per_user.py to enable them.")
+        return
+
+    for statement in STATEMENTS:
+        connection.execute(text(statement))
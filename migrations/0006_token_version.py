@@ -0,0 +1,20 @@
+"""Claims version of each user's tokens, bumped to revoke them all (e.g. on password change)."""
+from sqlalchemy import text
+
+
+# Built without blocking writes, see 0002
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    # Bumped versions come from a sequence, so a user's version only ever grows
+    "CREATE SEQUENCE IF NOT EXISTS token_version_seq",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0",
+    # Only users whose tokens were ever revoked are synced
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_users_token_version",
+    "CREATE INDEX CONCURRENTLY ix_users_token_version ON users (token_version) WHERE token_version > 0",
+]
+
+
+def upgrade(connection):
+    for statement in STATEMENTS:
+        connection.execute(text(statement))
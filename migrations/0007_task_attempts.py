@@ -0,0 +1,13 @@
+"""Number of times each queued task was claimed, so failing tasks are retried a bounded number of times."""
+from sqlalchemy import text
+
+
+STATEMENTS = [
+    # A constant default doesn't rewrite the table
+    "ALTER TABLE translation_tasks ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+]
+
+
+def upgrade(connection):
+    for statement in STATEMENTS:
+        connection.execute(text(statement))
@@ -0,0 +1,20 @@
+"""When each user's token version was last bumped, so workers re-read recent bumps rather than follow a cursor."""
+from sqlalchemy import text
+
+
+# Built without blocking writes, see 0002
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version_changed_at TIMESTAMP WITHOUT TIME ZONE",
+    "UPDATE users SET token_version_changed_at = now() WHERE token_version > 0 AND token_version_changed_at IS NULL",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_users_token_version_changed_at",
+    "CREATE INDEX CONCURRENTLY ix_users_token_version_changed_at ON users (token_version_changed_at) "
+    "WHERE token_version_changed_at IS NOT NULL",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_users_token_version",
+]
+
+
+def upgrade(connection):
+    for statement in STATEMENTS:
+        connection.execute(text(statement))
@@ -0,0 +1,35 @@
+"""Trigram index of fuzzy translation memory lookups led by user_id, as lookups only search the user's own tasks."""
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Built without blocking writes, see 0002
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # Lets a GiST index hold user_id next to the trigrams, so the ordered scan (<->) only walks the user's rows
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    # Built next to the index of 0005 and renamed once that is dropped, so lookups always have an index
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_translation_tasks_text_trgm_user",
+    "CREATE INDEX CONCURRENTLY ix_translation_tasks_text_trgm_user ON translation_tasks "
+    "USING gist (user_id, text_to_translate gist_trgm_ops) WHERE status = 'done' AND text_digest IS NOT NULL",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_translation_tasks_text_trgm",
+    "ALTER INDEX ix_translation_tasks_text_trgm_user RENAME TO ix_translation_tasks_text_trgm",
+]
+
+
+def upgrade(connection):
+    # Both extensions ship with the contrib modules, which some Postgres builds leave out
+    available = {row.name for row in connection.execute(text(
+        "SELECT name FROM pg_available_extensions WHERE name IN ('pg_trgm', 'btree_gist')"))}
+    if available != {"pg_trgm", "btree_gist"}:
+        logger.warning("pg_trgm or btree_gist is not available, fuzzy translation memory lookups are disabled or scan "
+                       "every user's texts. Install the Postgres contrib modules and run the statements of "
+                       "migrations/0009_fuzzy_memory_per_user.py.")
+        return
+
+    for statement in STATEMENTS:
+        connection.execute(text(statement))